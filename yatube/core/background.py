@@ -0,0 +1,69 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Spawned rather than forked: a fork would share the database
+    connections of the parent.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+class BoundedPool:
+    """
+    Process pool started on first use, with a queue of at most
+    queue_size pending jobs. Each kind of job gets its own pool and
+    settings, so slow ones do not hold up the others.
+    """
+
+    def __init__(self, workers_setting: str, queue_setting: str,
+                 workers: int = 2, queue_size: int = 100):
+        self.workers_setting = workers_setting
+        self.queue_setting = queue_setting
+        self.default_workers = workers
+        self.default_queue_size = queue_size
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def workers(self) -> int:
+        return getattr(settings, self.workers_setting, self.default_workers)
+
+    def queue_size(self) -> int:
+        return getattr(settings, self.queue_setting, self.default_queue_size)
+
+    def _done(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+        if future.exception() is not None:
+            logger.error('Фоновая задача не выполнена',
+                         exc_info=future.exception())
+
+    def submit(self, task, *args) -> bool:
+        """
+        Runs a module level function in the pool. Returns False when the
+        pool has no workers or its queue is full.
+        """
+        if not self.workers():
+            return False
+        with self._lock:
+            if self._pending >= self.queue_size():
+                return False
+            self._pending += 1
+            if self._executor is None:
+                self._executor = process_pool(self.workers())
+        self._executor.submit(task, *args).add_done_callback(self._done)
+        return True
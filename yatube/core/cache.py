@@ -0,0 +1,317 @@
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# SQLite limits the number of bound parameters of a statement.
+CHUNK_SIZE = 400
+# How many writes a process makes between two culls of the shared store.
+CULL_EVERY = 50
+
+LocalEntry = namedtuple('LocalEntry', 'pickled stamp expires checked')
+
+
+def new_stamp() -> int:
+    return random.getrandbits(62)
+
+
+class LocalLRU:
+    """Bounded in-process copy of shared rows, newest at the end"""
+
+    def __init__(self, max_entries: int, timeout: float):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def put(self, key, pickled, stamp, expires, now):
+        local_expires = now + self.timeout
+        if expires is not None:
+            local_expires = min(local_expires, expires)
+        with self._lock:
+            self._data[key] = LocalEntry(pickled, stamp, local_expires, now)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Django builds a backend per thread, the in-process tier is shared by
+# all of them, keyed by location like LocMemCache does.
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """
+    Cache shared by all workers of a host through a SQLite file, with a
+    bounded in-process LRU in front of it.
+
+    Every write stores a fresh random stamp next to the value. A local
+    copy is served only while its stamp matches the shared row, the
+    check is one indexed read that skips the value when nothing
+    changed, so a write or delete in any worker is seen by the others
+    on their next read. LOCAL_TRUST seconds allow serving a local copy
+    without the check, trading that guarantee for fewer reads.
+
+    OPTIONS: MAX_ENTRIES and CULL_FREQUENCY bound the shared store,
+    LOCAL_MAX_ENTRIES and LOCAL_TIMEOUT bound the in-process tier,
+    BUSY_TIMEOUT is how long a writer waits for the file lock.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local_trust = float(options.get('LOCAL_TRUST', 0))
+        with _local_tiers_lock:
+            self._local = _local_tiers.setdefault(location, LocalLRU(
+                int(options.get('LOCAL_MAX_ENTRIES', 1000)),
+                float(options.get('LOCAL_TIMEOUT', 300)),
+            ))
+        self._thread = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        db = getattr(self._thread, 'db', None)
+        if db is None:
+            db = sqlite3.connect(
+                self._location, timeout=self._busy_timeout,
+                isolation_level=None, check_same_thread=False,
+                uri=self._location.startswith('file:'),
+            )
+            if 'mode=memory' not in self._location:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                'expires REAL, stamp INTEGER NOT NULL, written REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self._thread.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Takes the write lock up front so read-modify-write is atomic"""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _fetch(self, wanted, now):
+        """
+        Shared rows of the wanted keys as {key: (stamp, expires, value)},
+        value is None when the row still has the given local stamp.
+        """
+        rows = {}
+        items = list(wanted.items())
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            values = ', '.join(['(?, ?)'] * len(chunk))
+            params = [param for item in chunk for param in item]
+            cursor = self._db.execute(
+                f'WITH wanted(key, stamp) AS (VALUES {values}) '
+                'SELECT cache.key, cache.stamp, cache.expires, '
+                'CASE WHEN cache.stamp IS wanted.stamp '
+                'THEN NULL ELSE cache.value END '
+                'FROM wanted JOIN cache ON cache.key = wanted.key '
+                'WHERE cache.expires IS NULL OR cache.expires > ?',
+                params + [now]
+            )
+            for key, stamp, expires, value in cursor:
+                rows[key] = (stamp, expires, value)
+        return rows
+
+    def _get_pickled(self, keys):
+        now = time.time()
+        found = {}
+        stale = {}
+        for key in keys:
+            entry = self._local.get(key, now)
+            if entry is not None and now - entry.checked <= self._local_trust:
+                found[key] = entry.pickled
+            else:
+                stale[key] = entry
+        if not stale:
+            return found
+        rows = self._fetch(
+            {key: entry and entry.stamp for key, entry in stale.items()}, now)
+        for key, entry in stale.items():
+            row = rows.get(key)
+            if row is None:
+                self._local.discard(key)
+                continue
+            stamp, expires, pickled = row
+            if pickled is None:
+                pickled = entry.pickled
+            self._local.put(key, pickled, stamp, expires, now)
+            found[key] = pickled
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        pickled = self._get_pickled([key]).get(key)
+        if pickled is None:
+            return default
+        return pickle.loads(pickled)
+
+    def get_many(self, keys, version=None):
+        key_map = {self._key(key, version): key for key in keys}
+        return {
+            key_map[key]: pickle.loads(pickled)
+            for key, pickled in self._get_pickled(key_map).items()
+        }
+
+    def _store(self, db, rows, now):
+        db.executemany(
+            'INSERT OR REPLACE INTO cache '
+            '(key, value, expires, stamp, written) VALUES (?, ?, ?, ?, ?)',
+            [row + (now,) for row in rows]
+        )
+        for key, pickled, expires, stamp in rows:
+            self._local.put(key, pickled, stamp, expires, now)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = [
+            (self._key(key, version),
+             pickle.dumps(value, self.pickle_protocol), expires, new_stamp())
+            for key, value in data.items()
+        ]
+        with self._transaction() as db:
+            self._store(db, rows, time.time())
+        self._maybe_cull(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        row = (key, pickle.dumps(value, self.pickle_protocol),
+               self._expires(timeout), new_stamp())
+        now = time.time()
+        with self._transaction() as db:
+            alive = db.execute(
+                'SELECT 1 FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)', (key, now)
+            ).fetchone()
+            if alive is None:
+                self._store(db, [row], now)
+        if alive is not None:
+            return False
+        self._maybe_cull(1)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)', (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            self._store(db, [(key, pickle.dumps(value, self.pickle_protocol),
+                              row[1], new_stamp())], now)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ?, stamp = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), new_stamp(), key, time.time())
+        )
+        self._local.discard(key)
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._local.discard(key)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys])
+        for key in keys:
+            self._local.discard(key)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+        self._local.clear()
+
+    def _maybe_cull(self, written):
+        self._writes += written
+        if self._writes < CULL_EVERY:
+            return
+        self._writes = 0
+        self._cull()
+
+    def _cull(self):
+        """Drops expired rows, then the oldest writes over MAX_ENTRIES"""
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count <= self._max_entries:
+                return
+            if self._cull_frequency == 0:
+                db.execute('DELETE FROM cache')
+                return
+            excess = max(count // self._cull_frequency,
+                         count - self._max_entries)
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY written LIMIT ?)', (excess,)
+            )
@@ -0,0 +1,149 @@
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+LOCK_KEY = 'lock:{}'
+# How often a worker without a value looks for the one being computed.
+POLL_INTERVAL = 0.05
+
+# expires is the soft deadline, the entry itself lives stale_timeout()
+# longer so it can be served while one worker recomputes it; delta is
+# how long the last computation took.
+Envelope = namedtuple('Envelope', 'value tag expires delta')
+
+
+def lock_timeout() -> float:
+    return getattr(settings, 'CACHE_LOCK_TIMEOUT', 10)
+
+
+def stale_timeout() -> int:
+    return getattr(settings, 'CACHE_STALE_TIMEOUT', 60 * 5)
+
+
+def early_beta() -> float:
+    return getattr(settings, 'CACHE_EARLY_BETA', 1.0)
+
+
+def must_refresh(envelope: Envelope, tag=None) -> bool:
+    """
+    Whether a cached value should be recomputed: its tag is outdated,
+    its soft deadline passed, or it lost the early recomputation draw
+    whose odds grow as the deadline nears and with how slow it is.
+    """
+    if envelope.tag != tag:
+        return True
+    if envelope.expires is None:
+        return False
+    gap = envelope.delta * early_beta() * -math.log(1 - random.random())
+    return time.time() + gap >= envelope.expires
+
+
+def wrap(value, timeout, tag=None, delta=0.0) -> Envelope:
+    expires = None if timeout is None else time.time() + timeout
+    return Envelope(value, tag, expires, delta)
+
+
+def storage_timeout(timeout):
+    return None if timeout is None else timeout + stale_timeout()
+
+
+def acquire(key) -> bool:
+    return cache.add(LOCK_KEY.format(key), True, lock_timeout())
+
+
+def release(key) -> None:
+    cache.delete(LOCK_KEY.format(key))
+
+
+def wait_for(key, tag=None):
+    """Waits for the worker holding the lock, returns its envelope"""
+    deadline = time.monotonic() + lock_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None and envelope.tag == tag:
+            return envelope
+        if not cache.has_key(LOCK_KEY.format(key)):
+            return None
+    return None
+
+
+def get_tagged_or_compute(key, compute, timeout, tag=None,
+                          cacheable=lambda value: True):
+    """
+    Cached value of the key, computed by a single worker at a time,
+    with the tag it was stored with. While that worker computes, the
+    others get the stale value and its old tag, or wait for the fresh
+    one when there is nothing to serve. A value is stale once the
+    timeout passes or when it was stored with a different tag.
+    """
+    envelope = cache.get(key)
+    if envelope is not None and not must_refresh(envelope, tag):
+        return envelope.value, envelope.tag
+    if not acquire(key):
+        if envelope is not None:
+            return envelope.value, envelope.tag
+        envelope = wait_for(key, tag)
+        if envelope is not None:
+            return envelope.value, envelope.tag
+        return compute(), tag
+    try:
+        started = time.monotonic()
+        value = compute()
+        if cacheable(value):
+            cache.set(key, wrap(value, timeout, tag,
+                                time.monotonic() - started),
+                      storage_timeout(timeout))
+        return value, tag
+    finally:
+        release(key)
+
+
+def get_or_compute(key, compute, timeout, tag=None,
+                   cacheable=lambda value: True):
+    """Cached value of the key, see get_tagged_or_compute"""
+    return get_tagged_or_compute(key, compute, timeout, tag, cacheable)[0]
+
+
+def get_many_or_compute(items: dict, compute, timeout, prepare=None) -> dict:
+    """
+    Cached values of many keys, items maps a key to what compute
+    takes. Missing values are computed right away, they are cheap
+    fragments; stale ones are refreshed by whoever takes the lock.
+    prepare, when given, gets all items about to be computed at once.
+    """
+    envelopes = cache.get_many(items)
+    values = {}
+    todo = {}
+    locked = []
+    try:
+        for key, item in items.items():
+            envelope = envelopes.get(key)
+            if envelope is not None and not must_refresh(envelope):
+                values[key] = envelope.value
+                continue
+            if envelope is not None:
+                if not acquire(key):
+                    values[key] = envelope.value
+                    continue
+                locked.append(key)
+            todo[key] = item
+        if todo and prepare is not None:
+            prepare(list(todo.values()))
+        fresh = {}
+        for key, item in todo.items():
+            started = time.monotonic()
+            values[key] = compute(item)
+            fresh[key] = wrap(values[key], timeout,
+                              delta=time.monotonic() - started)
+        if fresh:
+            cache.set_many(fresh, storage_timeout(timeout))
+    finally:
+        if locked:
+            cache.delete_many([LOCK_KEY.format(key) for key in locked])
+    return values
@@ -0,0 +1,47 @@
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+HOLE_PATTERN = re.compile(r'<!--hole:(?P<payload>[A-Za-z0-9_\-]+)-->')
+
+_fillers = {}
+
+
+def hole_filler(template_name: str):
+    """Registers a function that builds the per-request hole context"""
+    def decorator(func):
+        _fillers[template_name] = func
+        return func
+    return decorator
+
+
+def render_hole(request, template_name: str, args: dict) -> str:
+    context = dict(args)
+    filler = _fillers.get(template_name)
+    if filler is not None:
+        context.update(filler(request, **args))
+    return render_to_string(template_name, context, request=request)
+
+
+def hole_marker(template_name: str, args: dict) -> str:
+    payload = json.dumps([template_name, args]).encode()
+    payload = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+    return mark_safe(f'<!--hole:{payload}-->')
+
+
+def fill_holes(content: str, request) -> str:
+    """Renders every hole left in a shared page for the current user"""
+    def fill(match):
+        payload = match.group('payload')
+        payload = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        template_name, args = json.loads(payload)
+        return render_hole(request, template_name, args)
+    return HOLE_PATTERN.sub(fill, content)
+
+
+def punching_holes(request) -> bool:
+    return getattr(request, 'punch_holes', False)
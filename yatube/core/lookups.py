@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import router
+from django.http import Http404
+
+
+GENERATION_KEY = 'lookup:generation:{}'
+# Remembered in place of rows that do not exist.
+MISSING = object()
+
+
+class MemoizedLookup:
+    """
+    Per-process LRU of rows fetched by a unique field, unknown values
+    are remembered too. Entries are stamped with a generation kept in
+    the shared cache: any save or delete of the model bumps it, so all
+    workers drop their copies on the next lookup. Every hit builds a
+    fresh instance, callers may cache related objects on it freely.
+    """
+
+    def __init__(self, model, field, max_entries=1000, timeout=60 * 5,
+                 ignored_fields=()):
+        self.model = model
+        self.field = field
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.ignored_fields = set(ignored_fields)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def generation_key(self):
+        return GENERATION_KEY.format(self.model._meta.label_lower)
+
+    def generation(self):
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, int(time.time() * 1000), None)
+            generation = cache.get(self.generation_key)
+        return generation
+
+    def _remember(self, value, generation, row):
+        with self._lock:
+            self._data[value] = (generation, time.time() + self.timeout, row)
+            self._data.move_to_end(value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def _recall(self, value, generation):
+        with self._lock:
+            entry = self._data.get(value)
+            if entry is None:
+                return None
+            if entry[0] != generation or entry[1] <= time.time():
+                del self._data[value]
+                return None
+            self._data.move_to_end(value)
+            return entry[2]
+
+    def _instance(self, row):
+        field_names, values = row
+        db = router.db_for_read(self.model)
+        return self.model.from_db(db, field_names, values)
+
+    def get(self, value):
+        """The row with the given field value or None"""
+        generation = self.generation()
+        row = self._recall(value, generation)
+        if row is None:
+            fields = [
+                field.attname for field in self.model._meta.concrete_fields]
+            values = self.model._default_manager.filter(
+                **{self.field: value}).values_list(*fields).first()
+            row = MISSING if values is None else (fields, values)
+            self._remember(value, generation, row)
+        if row is MISSING:
+            return None
+        return self._instance(row)
+
+    def get_or_404(self, value):
+        instance = self.get(value)
+        if instance is None:
+            raise Http404(f'No {self.model._meta.object_name} matches '
+                          f'{self.field}={value!r}.')
+        return instance
+
+    def invalidate(self, sender, instance, update_fields=None, **kwargs):
+        """Signal receiver for post_save and post_delete of the model"""
+        if update_fields and set(update_fields) <= self.ignored_fields:
+            return
+        try:
+            cache.incr(self.generation_key)
+        except ValueError:
+            cache.set(self.generation_key, int(time.time() * 1000), None)
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,169 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .storage import is_hashed
+
+
+# Files named by their content never change, see core.storage.
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+SENDFILE_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_backend():
+    return getattr(settings, 'MEDIA_SENDFILE', None)
+
+
+def accel_prefix() -> str:
+    return getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+
+def media_max_age() -> int:
+    return getattr(settings, 'MEDIA_MAX_AGE', 60 * 60)
+
+
+class UnsatisfiableRange(ValueError):
+    pass
+
+
+def parse_range(header, size: int):
+    """
+    (first, last) byte of a single range request or None to send the
+    whole file: malformed and multipart ranges are ignored.
+    """
+    match = BYTE_RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        if not int(last) or not size:
+            raise UnsatisfiableRange
+        return max(size - int(last), 0), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise UnsatisfiableRange
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+
+class FileRange:
+    """
+    Reads at most length bytes of the file. It has no fileno() on
+    purpose: some file wrappers would sendfile() past the range.
+    """
+
+    def __init__(self, file, first, length):
+        file.seek(first)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def media_etag(name, file_stat) -> str:
+    if is_hashed(name):
+        return quote_etag(
+            posixpath.splitext(posixpath.basename(name))[0])
+    return quote_etag(f'{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}')
+
+
+def patch_media_caching(response, name) -> None:
+    if is_hashed(name):
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=media_max_age())
+
+
+def file_response(request, path, size, content_type, etag):
+    """
+    Bytes sent by Python: a FileResponse of the whole file or its tail
+    is streamed with the server's wsgi.file_wrapper, so sendfile() when
+    it has one; bounded ranges are read in blocks.
+    """
+    header = request.headers.get('Range')
+    if request.headers.get('If-Range', etag) != etag:
+        # The client has another version, it gets the whole file.
+        header = None
+    try:
+        byte_range = parse_range(header, size)
+    except UnsatisfiableRange:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+        return response
+    first, last = byte_range
+    length = last - first + 1
+    if last == size - 1:
+        file.seek(first)
+        body = file
+    else:
+        body = FileRange(file, first, length)
+    response = FileResponse(body, status=206, content_type=content_type)
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def media_response(request, name):
+    """
+    Response for a file under MEDIA_ROOT. With MEDIA_SENDFILE set it
+    carries only headers and the web server sends the file itself,
+    handling ranges on its own.
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        file_stat = os.stat(path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('Файл не найден')
+    etag = media_etag(name, file_stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime))
+    if response is None:
+        content_type = (mimetypes.guess_type(path)[0]
+                        or 'application/octet-stream')
+        backend = sendfile_backend()
+        if backend in SENDFILE_HEADERS:
+            response = HttpResponse(content_type=content_type)
+            response[SENDFILE_HEADERS[backend]] = (
+                accel_prefix().rstrip('/') + '/' + quote(name)
+                if backend == 'x-accel-redirect' else path
+            )
+        else:
+            response = file_response(
+                request, path, file_stat.st_size, content_type, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    patch_media_caching(response, name)
+    return response
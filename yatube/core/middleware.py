@@ -0,0 +1,35 @@
+import logging
+
+from django.conf import settings
+
+from .query_budget import (
+    QueryBudgetExceeded, budget_for, budget_message, count_queries
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts database queries of every request and compares them to the
+    view budget: logs a warning by default, raises when
+    QUERY_BUDGET_RAISE is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        budget = budget_for(match.view_name)
+        if len(counter) > budget:
+            message = budget_message(match.view_name, counter, budget)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
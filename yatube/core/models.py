@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class StoredFile(models.Model):
+    """References to a file of the content addressed storage"""
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Имя файла'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,68 @@
+import logging
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+logger = logging.getLogger(__name__)
+
+
+def surrogate_max_age() -> int:
+    return getattr(settings, 'SURROGATE_MAX_AGE', 60 * 60 * 24)
+
+
+def add_surrogate_keys(response, keys) -> None:
+    """Tags the response with keys a purge request can drop it by"""
+    present = response.get(SURROGATE_KEY_HEADER, '').split()
+    response[SURROGATE_KEY_HEADER] = ' '.join(
+        dict.fromkeys(present + list(keys)))
+
+
+def patch_proxy_headers(request, response, stale=False) -> None:
+    """
+    Lets a shared proxy keep pages of anonymous users until a purge,
+    browsers revalidate every time. Pages with filled per-user holes
+    stay private. A stale copy is not stored at all: the purge for it
+    has already been sent, so no later one would drop it.
+    """
+    if stale:
+        patch_cache_control(response, private=True, no_store=True)
+    elif request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0,
+                            s_maxage=surrogate_max_age())
+    patch_vary_headers(response, ('Cookie',))
+
+
+def purge_enabled() -> bool:
+    return bool(getattr(settings, 'PURGE_URL', None))
+
+
+def purge(*keys) -> None:
+    """
+    Asks the proxy to drop responses tagged with the keys once the
+    current transaction commits, so it cannot refetch the old rows.
+    """
+    if not purge_enabled() or not keys:
+        return
+    keys = sorted(set(keys))
+    transaction.on_commit(lambda: send_purge(keys))
+
+
+def send_purge(keys) -> None:
+    request = urllib.request.Request(
+        settings.PURGE_URL, method='PURGE',
+        headers={SURROGATE_KEY_HEADER: ' '.join(keys)},
+    )
+    try:
+        with urllib.request.urlopen(
+                request, timeout=getattr(settings, 'PURGE_TIMEOUT', 2)):
+            pass
+    except (urllib.error.URLError, OSError) as error:
+        logger.warning('Не удалось сбросить ключи %s: %s', keys, error)
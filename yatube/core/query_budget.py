@@ -0,0 +1,72 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+
+_background = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def off_budget():
+    """
+    Marks background work run inline, as without workers in tests: its
+    queries are counted apart and do not use up the request budget.
+    """
+    depth = getattr(_background, 'depth', 0)
+    _background.depth = depth + 1
+    try:
+        yield
+    finally:
+        _background.depth = depth
+
+
+class QueryCounter:
+    """Database execute wrapper that remembers every executed query"""
+
+    def __init__(self):
+        self.queries = []
+        self.background = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_background, 'depth', 0):
+            self.background += 1
+        else:
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def budget_for(view_name: str) -> int:
+    """Query limit of a view: its own entry in QUERY_BUDGETS or default"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'QUERY_BUDGET', 20))
+
+
+def budget_message(name: str, counter: QueryCounter, budget: int) -> str:
+    queries = '\n'.join(counter.queries)
+    return (f'{name} выполнил {len(counter)} запросов к базе '
+            f'(и {counter.background} в фоне), лимит {budget}:\n{queries}')
+
+
+@contextmanager
+def assert_max_queries(budget: int, name: str = 'Блок кода'):
+    """Fails when the wrapped block runs more than budget queries"""
+    with count_queries() as counter:
+        yield counter
+    if len(counter) > budget:
+        raise QueryBudgetExceeded(budget_message(name, counter, budget))
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_hash(content) -> str:
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_hashed(name: str) -> bool:
+    return HASHED_NAME.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Names files by the sha256 of their content, sharded under the
+    directory they were saved to: posts/ab/cd/abcd....jpg. Bytes that
+    are stored already are not written again. Every save is counted
+    as a reference and delete() drops one, the file goes with the last.
+    """
+
+    def hashed_name(self, name, content) -> str:
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(os.path.dirname(name), digest[:2],
+                              digest[2:4], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            stored = super()._save(name, content)
+            if stored != name:
+                # Another worker has just written the same bytes.
+                super().delete(stored)
+        self.reference(name)
+        return name
+
+    def reference(self, name) -> None:
+        """Counts one more row pointing to a stored file"""
+        with transaction.atomic():
+            _, created = StoredFile.objects.get_or_create(
+                name=name, defaults={'references': 1})
+            if not created:
+                StoredFile.objects.filter(name=name).update(
+                    references=F('references') + 1)
+
+    def delete(self, name):
+        """
+        Drops one reference. Files stored before the storage was
+        switched on have no count and are removed right away.
+        """
+        with transaction.atomic():
+            StoredFile.objects.filter(name=name, references__gt=0).update(
+                references=F('references') - 1)
+            if StoredFile.objects.filter(
+                    name=name, references__gt=0).exists():
+                return
+            StoredFile.objects.filter(name=name).delete()
+        transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name) -> None:
+        if StoredFile.objects.filter(name=name).exists():
+            return
+        try:
+            super().delete(name)
+        except SuspiciousFileOperation:
+            # Rows may point outside MEDIA_ROOT, such files are not ours.
+            pass
@@ -0,0 +1,18 @@
+from django import template
+
+from core.holes import hole_marker, punching_holes, render_hole
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **args):
+    """
+    Includes a per-user fragment. While a shared page is rendered for
+    the cache it leaves a marker that is filled in after the lookup.
+    """
+    request = context.get('request')
+    if punching_holes(request):
+        return hole_marker(template_name, args)
+    return render_hole(request, template_name, args)
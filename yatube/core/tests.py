@@ -0,0 +1,291 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import (
+    Client, SimpleTestCase, TransactionTestCase, override_settings
+)
+
+from .cache import LocalLRU, TwoTierCache
+from .cache_access import (
+    acquire, get_many_or_compute, get_or_compute, must_refresh, wrap
+)
+from .models import StoredFile
+from .storage import ContentAddressedStorage
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.location = os.path.join(self.tmp_dir, 'cache.sqlite3')
+        self.worker = self.new_worker()
+        self.other_worker = self.new_worker()
+
+    def new_worker(self, **options):
+        """Бэкенд со своим локальным уровнем, как в отдельном процессе."""
+        worker = TwoTierCache(self.location, {'OPTIONS': options})
+        worker._local = LocalLRU(
+            options.get('LOCAL_MAX_ENTRIES', 1000),
+            options.get('LOCAL_TIMEOUT', 300),
+        )
+        return worker
+
+    def test_basic_operations(self):
+        """Бэкенд поддерживает операции, которыми пользуются кеши ленты."""
+        self.worker.set('key', {'value': 1})
+        self.assertEqual(self.worker.get('key'), {'value': 1})
+        self.assertFalse(self.worker.add('key', 'other'))
+        self.assertTrue(self.worker.add('new', 'value'))
+        self.worker.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            self.worker.get_many(['a', 'b', 'missing']), {'a': 1, 'b': 2})
+        self.assertEqual(self.worker.incr('a', 5), 6)
+        with self.assertRaises(ValueError):
+            self.worker.incr('missing')
+        self.worker.delete('a')
+        self.assertIsNone(self.worker.get('a'))
+        self.worker.clear()
+        self.assertIsNone(self.worker.get('key'))
+
+    def test_expired_values_are_missing(self):
+        """Просроченное значение не отдаётся и уступает место add."""
+        self.worker.set('key', 'value', -1)
+        self.assertIsNone(self.worker.get('key'))
+        self.assertTrue(self.worker.add('key', 'value'))
+
+    def test_writes_are_seen_by_other_workers(self):
+        """Запись и удаление в одном процессе видны остальным."""
+        self.worker.set('key', 'old')
+        self.assertEqual(self.other_worker.get('key'), 'old')
+
+        self.worker.set('key', 'new')
+        self.assertEqual(self.other_worker.get('key'), 'new')
+
+        self.worker.delete('key')
+        self.assertIsNone(self.other_worker.get('key'))
+
+    def test_incr_is_shared(self):
+        """Счётчик версий растёт от инкрементов всех процессов."""
+        self.worker.set('version', 1)
+        self.worker.incr('version')
+        self.other_worker.incr('version')
+        self.assertEqual(self.worker.get('version'), 3)
+        self.assertEqual(self.other_worker.get('version'), 3)
+
+    def test_local_copy_is_served_while_stamp_matches(self):
+        """Локальная копия отдаётся, пока запись в общем хранилище та же."""
+        self.worker.set('key', 'value')
+        self.other_worker.get('key')
+        entry = self.other_worker._local.get(
+            self.other_worker.make_key('key'), 0)
+        rows = self.other_worker._fetch(
+            {self.other_worker.make_key('key'): entry.stamp}, 0)
+
+        self.assertIsNone(rows[self.other_worker.make_key('key')][2])
+        self.assertEqual(self.other_worker.get('key'), 'value')
+
+    def test_local_tier_is_bounded(self):
+        """Локальный уровень хранит не больше LOCAL_MAX_ENTRIES значений."""
+        worker = self.new_worker(LOCAL_MAX_ENTRIES=2)
+        for num in range(5):
+            worker.set(f'key{num}', num)
+
+        self.assertEqual(len(worker._local._data), 2)
+        self.assertEqual(worker.get('key0'), 0)
+
+    def test_shared_store_is_culled(self):
+        """Общее хранилище сбрасывает старые записи сверх MAX_ENTRIES."""
+        worker = self.new_worker(MAX_ENTRIES=10)
+        for num in range(60):
+            worker.set(f'key{num}', num)
+
+        count = worker._db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        self.assertLessEqual(count[0], 20)
+        self.assertEqual(worker.get('key59'), 59)
+
+
+@override_settings(CACHE_LOCK_TIMEOUT=0.2)
+class CacheAccessTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='fresh')
+
+    def test_value_is_computed_once(self):
+        """Значение вычисляется один раз и берётся из кеша."""
+        for _ in range(3):
+            self.assertEqual(get_or_compute('key', self.compute, 60), 'fresh')
+        self.compute.assert_called_once()
+
+    def test_outdated_tag_is_recomputed(self):
+        """Значение с устаревшей меткой вычисляется заново."""
+        get_or_compute('key', lambda: 'old', 60, tag=1)
+        self.assertEqual(
+            get_or_compute('key', self.compute, 60, tag=2), 'fresh')
+
+    def test_stale_value_is_served_while_locked(self):
+        """Пока другой процесс пересчитывает ключ, отдаётся старое значение."""
+        get_or_compute('key', lambda: 'old', 60, tag=1)
+        self.assertTrue(acquire('key'))
+
+        self.assertEqual(get_or_compute('key', self.compute, 60, tag=2), 'old')
+        self.compute.assert_not_called()
+
+    def test_missing_value_is_computed_after_lock_timeout(self):
+        """Без старого значения ждём не дольше таймаута блокировки."""
+        self.assertTrue(acquire('key'))
+
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'fresh')
+        self.compute.assert_called_once()
+
+    def test_early_recomputation(self):
+        """Медленное значение пересчитывается заранее, быстрое — нет."""
+        with mock.patch('random.random', return_value=0.5):
+            self.assertTrue(must_refresh(wrap('value', 10, delta=60)))
+            self.assertFalse(must_refresh(wrap('value', 10, delta=0.01)))
+            self.assertFalse(must_refresh(wrap('value', None, delta=60)))
+
+    def test_many_values_share_the_lock(self):
+        """Устаревший фрагмент под чужой блокировкой отдаётся как есть."""
+        get_many_or_compute({'a': 'a', 'b': 'b'}, str.upper, -1)
+        self.assertTrue(acquire('a'))
+
+        values = get_many_or_compute({'a': 'a', 'b': 'b'}, str.title, 60)
+
+        self.assertEqual(values, {'a': 'A', 'b': 'B'})
+        self.assertEqual(
+            get_many_or_compute({'b': 'b'}, str.lower, 60), {'b': 'B'})
+
+
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.tmp_dir)
+
+    def test_identical_content_stored_once(self):
+        """Одинаковое содержимое получает одно имя в шардированном каталоге."""
+        name = self.storage.save('posts/a.txt', ContentFile(b'meme'))
+
+        self.assertEqual(
+            self.storage.save('posts/b.TXT', ContentFile(b'meme')), name)
+        self.assertNotEqual(
+            self.storage.save('posts/c.txt', ContentFile(b'other')), name)
+        self.assertRegex(name, r'^posts/(\w{2})/(\w{2})/\1\2\w{60}\.txt$')
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется только вместе с последней ссылкой."""
+        name = self.storage.save('posts/a.txt', ContentFile(b'meme'))
+        self.storage.save('posts/b.txt', ContentFile(b'meme'))
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_legacy_files_are_deleted(self):
+        """Файлы без счетчика ссылок удаляются сразу."""
+        path = os.path.join(self.tmp_dir, 'legacy.txt')
+        with open(path, 'wb') as legacy:
+            legacy.write(b'old')
+
+        self.storage.delete('legacy.txt')
+
+        self.assertFalse(os.path.exists(path))
+
+
+class MediaServeTest(SimpleTestCase):
+    HASHED_NAME = 'thumbnails/ab/cd/' + 'abcd' * 16 + '.jpg'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.tmp_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name in (self.HASHED_NAME, 'posts/photo.jpg'):
+            path = os.path.join(self.tmp_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as media:
+                media.write(b'0123456789')
+        self.client = Client()
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def test_hashed_files_are_immutable(self):
+        """Файлы с хешем в имени кешируются на год без проверок."""
+        response = self.get(self.HASHED_NAME)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_other_files_are_revalidated(self):
+        """Остальные файлы кешируются ненадолго и проверяются по ETag."""
+        response = self.get('posts/photo.jpg')
+
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertEqual(self.get(
+            'posts/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+
+    def test_byte_ranges(self):
+        """Запрос диапазона отдает только его байты."""
+        cases = {
+            'bytes=2-5': (b'2345', 'bytes 2-5/10'),
+            'bytes=7-': (b'789', 'bytes 7-9/10'),
+            'bytes=-3': (b'789', 'bytes 7-9/10'),
+            'bytes=8-100': (b'89', 'bytes 8-9/10'),
+        }
+        for header, (content, content_range) in cases.items():
+            with self.subTest(range=header):
+                response = self.get(self.HASHED_NAME, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content), content)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'],
+                                 str(len(content)))
+
+    def test_unsatisfiable_and_outdated_ranges(self):
+        """Диапазон за концом файла отклоняется, устаревший If-Range — нет."""
+        self.assertEqual(self.get(
+            self.HASHED_NAME, HTTP_RANGE='bytes=10-').status_code, 416)
+        response = self.get(self.HASHED_NAME, HTTP_RANGE='bytes=2-5',
+                            HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_nginx_sends_the_file(self):
+        """С nginx ответ только указывает на внутренний адрес файла."""
+        response = self.get(self.HASHED_NAME)
+
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/' + self.HASHED_NAME)
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_apache_sends_the_file(self):
+        """С Apache ответ передает путь к файлу."""
+        response = self.get('posts/photo.jpg')
+
+        self.assertEqual(response['X-Sendfile'],
+                         os.path.join(self.tmp_dir, 'posts/photo.jpg'))
+
+    def test_missing_and_outside_files(self):
+        """Несуществующие файлы и пути за пределами MEDIA_ROOT не отдаются."""
+        for name in ('posts/missing.jpg', 'posts', '../../settings.py'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
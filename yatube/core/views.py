@@ -1,4 +1,18 @@
+import logging
+from collections import deque
+
+from django.http import HttpResponseNotAllowed, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+
+from .media import media_response
+from .proxy import SURROGATE_KEY_HEADER
+
+
+logger = logging.getLogger(__name__)
+# Keys of the last purge requests the stand-in receiver got.
+received_purges = deque(maxlen=100)
 
 
 def page_not_found(request, exception):
@@ -15,3 +29,20 @@ def server_error(request):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@csrf_exempt
+def purge_receiver(request):
+    """Stand-in for the proxy purge endpoint, remembers the keys sent"""
+    if request.method != 'PURGE':
+        return HttpResponseNotAllowed(['PURGE'])
+    keys = request.headers.get(SURROGATE_KEY_HEADER, '').split()
+    received_purges.append(keys)
+    logger.info('Сброшены ключи: %s', ' '.join(keys))
+    return JsonResponse({'purged': keys})
+
+
+@require_safe
+def serve_media(request, path):
+    """MEDIA_URL outside of a web server that serves it directly"""
+    return media_response(request, path)
@@ -1,6 +1,17 @@
+from django import forms
 from django.contrib import admin
 
+from .forms import PostForm
 from .models import Post, Group, Follow, Comment
+from .search import search_posts
+
+
+class PostAdminForm(forms.ModelForm):
+    clean_image = PostForm.clean_image
+
+    class Meta:
+        model = Post
+        fields = '__all__'
 
 
 @admin.register(Post)
@@ -10,6 +21,12 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    form = PostAdminForm
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_posts(queryset, search_term), False
 
 
 @admin.register(Group)
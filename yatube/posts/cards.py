@@ -0,0 +1,41 @@
+import hashlib
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.cache_access import get_many_or_compute
+from .thumbnails import attach_thumbnails
+
+
+CARD_TEMPLATE = 'includes/post_card.html'
+
+
+def card_cache_timeout() -> int:
+    return getattr(settings, 'POST_CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def card_key(post) -> str:
+    """
+    Post id plus its modification version; the author and group parts
+    of the card are hashed in so renames reach cached cards too.
+    """
+    related = '|'.join((
+        post.author.username,
+        post.author.get_full_name(),
+        post.group.slug if post.group else '',
+    ))
+    digest = hashlib.md5(related.encode()).hexdigest()[:12]
+    return f'post_card:{post.pk}:{post.modified.timestamp()}:{digest}'
+
+
+def render_card(post) -> str:
+    return render_to_string(CARD_TEMPLATE, {'post': post})
+
+
+def render_cards(posts) -> list:
+    """Renders post cards, fetching and storing cached ones in bulk"""
+    posts = {card_key(post): post for post in posts}
+    cards = get_many_or_compute(posts, render_card, card_cache_timeout(),
+                                prepare=attach_thumbnails)
+    return [mark_safe(cards[key]) for key in posts]
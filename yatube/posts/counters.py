@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Post, Comment, Follow, AuthorStats
+
+
+User = get_user_model()
+
+
+def author_stats(user) -> AuthorStats:
+    """Returns maintained user counters, zeros if nothing counted yet"""
+    user_id = getattr(user, 'pk', user)
+    stats = AuthorStats.objects.filter(user_id=user_id).first()
+    return stats or AuthorStats(user_id=user_id)
+
+
+def bump_author(user_id: int, field: str, delta: int) -> None:
+    """Shifts one of the user counters with an F() update"""
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    if stats.update(**{field: F(field) + delta}) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(user_id=user_id, **{field: delta})
+    except IntegrityError:
+        AuthorStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta})
+
+
+def bump_comments(post_id: int, delta: int) -> None:
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def _count_of(queryset, field: str, outer: str = 'pk'):
+    """Correlated COUNT(*) of queryset rows pointing at the outer row"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef(outer)}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount_all() -> None:
+    """Recomputes every counter in bulk from the source tables"""
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk)
+         for pk in User.objects.filter(stats__isnull=True)
+         .values_list('pk', flat=True)],
+        ignore_conflicts=True
+    )
+    AuthorStats.objects.update(
+        posts_count=_count_of(Post.objects, 'author', 'user'),
+        followers_count=_count_of(Follow.objects, 'author', 'user'),
+        following_count=_count_of(Follow.objects, 'user', 'user'),
+    )
+    Post.objects.update(comments_count=_count_of(Comment.objects, 'post'))
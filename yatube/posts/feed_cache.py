@@ -0,0 +1,210 @@
+import functools
+import hashlib
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (
+    get_cache_key, get_conditional_response, learn_cache_key
+)
+from django.utils.http import quote_etag
+
+from core.cache_access import get_tagged_or_compute, storage_timeout, wrap
+from core.holes import fill_holes
+from core.proxy import patch_proxy_headers
+from .models import Comment, Group, Post, User
+
+
+VERSION_KEY = 'feed:version:{}'
+LEARNING_KEY_PREFIX = 'feed-learning'
+# Rendered on every feed page: group links and media URLs.
+SHARED_SCOPE = 'shared'
+
+
+def index_scope() -> str:
+    return 'index'
+
+
+def group_scope(slug: str) -> str:
+    return f'group:{quote(slug)}'
+
+
+def author_scope(username: str) -> str:
+    return f'author:{quote(username)}'
+
+
+def post_scope(post_id: int) -> str:
+    return f'post:{post_id}'
+
+
+def author_scopes(author_id) -> list:
+    username = User.objects.filter(pk=author_id).values_list(
+        'username', flat=True).first()
+    return [author_scope(username)] if username is not None else []
+
+
+def post_author_scopes(post_id) -> list:
+    username = User.objects.filter(posts__pk=post_id).values_list(
+        'username', flat=True).first()
+    return [author_scope(username)] if username is not None else []
+
+
+def post_scopes(group_id, author_id) -> list:
+    """Feeds a post with the given group and author is rendered on"""
+    scopes = [index_scope()] + author_scopes(author_id)
+    slug = Group.objects.filter(pk=group_id).values_list(
+        'slug', flat=True).first()
+    if slug is not None:
+        scopes.append(group_scope(slug))
+    return scopes
+
+
+def author_feed_scopes(author_id) -> list:
+    """
+    Pages that show the name of an author: the feeds and pages of their
+    posts and the pages of posts they commented on.
+    """
+    scopes = [index_scope()] + author_scopes(author_id)
+    slugs = Group.objects.filter(posts__author_id=author_id).values_list(
+        'slug', flat=True).distinct()
+    scopes += [group_scope(slug) for slug in slugs]
+    post_ids = set(Post.objects.filter(author_id=author_id).values_list(
+        'pk', flat=True))
+    post_ids.update(Comment.objects.filter(author_id=author_id).values_list(
+        'post_id', flat=True))
+    scopes += [post_scope(post_id) for post_id in post_ids]
+    return scopes
+
+
+def feed_cache_timeout() -> int:
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_versions(scopes) -> list:
+    """Current version of every scope, new scopes start at the clock"""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes) -> None:
+    """
+    Invalidates every cached page rendered from the given scopes. Each
+    scope gets a fresh clock-based version instead of an increment, so
+    any number of them is written in one cache transaction.
+    """
+    if scopes:
+        cache.set_many({VERSION_KEY.format(scope): time.time_ns()
+                        for scope in scopes}, None)
+
+
+def render_shared(view, request, *args, **kwargs):
+    """Renders the view leaving holes in place of per-user fragments"""
+    request.punch_holes = True
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        request.punch_holes = False
+
+
+def cacheable(response) -> bool:
+    return response.status_code == 200 and not response.streaming
+
+
+def page_etag(request, versions) -> str:
+    """
+    Validator of the page as the user sees it: the shared copy is
+    identified by the versions, the filled holes by the user and the
+    CSRF token the forms in them carry, it changes on login.
+    """
+    raw = (f'{request.user.pk}:{request.META.get("CSRF_COOKIE", "")}:'
+           + '.'.join(map(str, versions)))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def fill_response(response, request):
+    if response.streaming:
+        return response
+    response.content = fill_holes(response.content.decode(), request)
+    return response
+
+
+def learning_key(request, key_prefix) -> str:
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'{LEARNING_KEY_PREFIX}.{key_prefix}.{url}'
+
+
+def render_and_learn(render, request, key_prefix, timeout, versions):
+    """Renders the page and stores it under its learned cache key"""
+    response = render()
+    if cacheable(response):
+        cache_key = learn_cache_key(
+            request, response, timeout, key_prefix, cache)
+        cache.set(cache_key, wrap(response, timeout, versions),
+                  storage_timeout(timeout))
+    return response
+
+
+def cache_feed(scopes, hole_scopes=None):
+    """
+    Caches a GET response tagged with the versions of the scopes the
+    page is rendered from, scopes(request, **kwargs) lists them. A write
+    bumping one of the versions makes the page stale: one worker renders
+    it again while the others keep serving the old copy.
+    One copy is shared by all users: per-user fragments are holes
+    filled in after the lookup. Scopes the holes are rendered from,
+    listed by hole_scopes, only change the ETag: a client holding the
+    current one gets 304 before the page is looked up or rendered.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_scopes = scopes(request, *args, **kwargs)
+            extra_scopes = (hole_scopes(request, *args, **kwargs)
+                            if hole_scopes else [])
+            all_versions = get_versions(page_scopes + extra_scopes)
+            versions = tuple(all_versions[:len(page_scopes)])
+            etag = page_etag(request, all_versions)
+            # The page may not exist, only a matching ETag proves it does.
+            if request.META.get('HTTP_IF_NONE_MATCH', '').strip() == '*':
+                response = None
+            else:
+                response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                patch_proxy_headers(request, response)
+                return response
+            key_prefix = 'feed:' + '.'.join(page_scopes)
+            timeout = feed_cache_timeout()
+            cache_key = get_cache_key(request, key_prefix, 'GET', cache)
+            render = functools.partial(
+                render_shared, view, request, *args, **kwargs)
+            if cache_key is None:
+                # Until the header list of the URL is learned the page
+                # is rendered under a key of the URL alone, still by a
+                # single worker at a time.
+                cache_key = learning_key(request, key_prefix)
+                render = functools.partial(
+                    render_and_learn, render, request, key_prefix, timeout,
+                    versions)
+            response, served = get_tagged_or_compute(
+                cache_key, render, timeout, tag=versions,
+                cacheable=cacheable,
+            )
+            response = fill_response(response, request)
+            if cacheable(response):
+                # A stale copy served during a recompute must not be
+                # validated as the current page.
+                if served == versions:
+                    response['ETag'] = etag
+                patch_proxy_headers(
+                    request, response, stale=served != versions)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,72 @@
+import time
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+
+FOLLOW_SET_KEY = 'follows:{}'
+GENERATION_KEY = 'follows:generation:{}'
+# Unsigned 32-bit ids, the width of an AutoField.
+TYPECODE = 'I'
+
+
+def _generation(user_id: int, known=None) -> int:
+    if known is not None:
+        return known
+    key = GENERATION_KEY.format(user_id)
+    cache.add(key, int(time.time() * 1000), None)
+    return cache.get(key)
+
+
+def _load(user_id: int, generation: int) -> array:
+    ids = array(TYPECODE, Follow.objects.filter(user_id=user_id).order_by(
+        'author_id').values_list('author_id', flat=True))
+    cache.set(FOLLOW_SET_KEY.format(user_id),
+              (generation, ids.tobytes()), None)
+    return ids
+
+
+def followed_ids(user_id: int) -> array:
+    """
+    Sorted ids of the authors the user follows. The cached array is
+    stamped with the generation it was read at and is used only while
+    that generation is current.
+    """
+    set_key = FOLLOW_SET_KEY.format(user_id)
+    generation_key = GENERATION_KEY.format(user_id)
+    found = cache.get_many([set_key, generation_key])
+    generation = _generation(user_id, found.get(generation_key))
+    stored = found.get(set_key)
+    if stored is None or stored[0] != generation:
+        return _load(user_id, generation)
+    ids = array(TYPECODE)
+    ids.frombytes(stored[1])
+    return ids
+
+
+def is_following(user_id: int, author_id: int) -> bool:
+    ids = followed_ids(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def _bump(user_id: int) -> None:
+    key = GENERATION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def forget_followed(user_id: int) -> None:
+    """
+    Drops the cached set after a follow or unfollow. Bumped now so the
+    writer sees its change, and again on commit: a set read by another
+    worker before the commit carries a generation that is then stale.
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
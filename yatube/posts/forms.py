@@ -1,5 +1,6 @@
 from django import forms
 
+from .ingest import ingest_upload
 from .models import Post, Comment
 
 
@@ -12,6 +13,9 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        return ingest_upload(self.cleaned_data['image'])
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
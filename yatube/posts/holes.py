@@ -0,0 +1,22 @@
+from core.holes import hole_filler
+
+from .counters import author_stats
+from .follow_set import is_following
+from .forms import CommentForm
+
+
+@hole_filler('includes/follow_button.html')
+def follow_button(request, author, author_id):
+    following = (request.user.is_authenticated
+                 and is_following(request.user.pk, author_id))
+    return {'following': following}
+
+
+@hole_filler('includes/author_posts_count.html')
+def author_posts_count(request, author_id):
+    return {'count_posts': author_stats(author_id).posts_count}
+
+
+@hole_filler('includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'form': CommentForm()}
@@ -0,0 +1,85 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from PIL import Image, ImageOps
+
+
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
+
+
+def max_image_pixels() -> int:
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 50 * 1000 * 1000)
+
+
+def max_image_side() -> int:
+    return getattr(settings, 'IMAGE_MAX_SIDE', 2048)
+
+
+def check_dimensions(upload) -> None:
+    """
+    Rejects images with too many pixels; Image.open reads only the
+    header, nothing is decoded yet.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            pixels = image.width * image.height
+    except Image.DecompressionBombError:
+        pixels = None
+    except (OSError, ValueError):
+        # Not an image at all, ImageField reports it.
+        return
+    finally:
+        upload.seek(0)
+    if pixels is None or pixels > max_image_pixels():
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(limit)s мегапикселей.',
+            code='image_too_large',
+            params={'limit': max_image_pixels() // (1000 * 1000)},
+        )
+
+
+def has_alpha(image) -> bool:
+    return (image.mode in ('RGBA', 'LA', 'PA')
+            or (image.mode == 'P' and 'transparency' in image.info))
+
+
+def ingest(upload):
+    """
+    Upright copy of the upload that fits IMAGE_MAX_SIDE, without EXIF
+    and other metadata. Transparent images stay PNG, the rest become
+    JPEG; animations are kept as they are.
+    """
+    side = max_image_side()
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if getattr(image, 'is_animated', False):
+            upload.seek(0)
+            return upload
+        # JPEG decodes straight at a reduced scale close to the target.
+        image.draft('RGB', (side, side))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((side, side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if has_alpha(image):
+            image.convert('RGBA').save(buffer, 'PNG', optimize=True)
+            extension, content_type = 'png', 'image/png'
+        else:
+            image.convert('RGB').save(buffer, 'JPEG', icc_profile=icc_profile,
+                                      **JPEG_OPTIONS)
+            extension, content_type = 'jpg', 'image/jpeg'
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return SimpleUploadedFile(
+        f'{stem}.{extension}', buffer.getvalue(), content_type)
+
+
+def ingest_upload(image):
+    """clean_image of forms with Post.image, keeps stored files as is"""
+    if not isinstance(image, UploadedFile):
+        return image
+    check_dimensions(image)
+    return ingest(image)
@@ -0,0 +1,8 @@
+from core.lookups import MemoizedLookup
+from .models import Group, User
+
+
+group_by_slug = MemoizedLookup(Group, 'slug')
+# Logins only touch last_login, which no page shows.
+user_by_username = MemoizedLookup(
+    User, 'username', ignored_fields={'last_login'})
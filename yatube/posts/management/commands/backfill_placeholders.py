@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.background import process_pool
+from posts.feed_cache import SHARED_SCOPE, bump
+from posts.models import Post
+from posts.thumbnails import placeholder_for
+
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Считает превью картинок постов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число процессов, 0 — без пула'
+        )
+
+    def handle(self, *args, **options):
+        pending = list(Post.objects.exclude(image='').filter(
+            image_placeholder='').values_list('pk', 'image'))
+        workers = options['workers']
+        if workers and pending:
+            with process_pool(workers) as pool:
+                results = list(pool.map(
+                    placeholder_for, *zip(*pending), chunksize=16))
+        else:
+            results = [placeholder_for(*item) for item in pending]
+        now = timezone.now()
+        posts = []
+        for post_id, placeholder in results:
+            if placeholder is not None:
+                posts.append(Post(pk=post_id, modified=now,
+                                  image_placeholder=placeholder))
+        Post.objects.bulk_update(
+            posts, ['modified', 'image_placeholder'], batch_size=BATCH_SIZE)
+        if posts:
+            # Cards are keyed by modified, pages have to be dropped.
+            bump(SHARED_SCOPE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью посчитаны для постов: {len(posts)} из {len(pending)}'))
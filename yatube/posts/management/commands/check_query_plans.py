@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts.counters import author_stats
+from posts.models import Post, Comment, Follow
+from posts.timeline import keyed_follow_feed
+from posts.utils import (
+    create_page_obj, create_comments_page, encode_cursor, OLDER, NEWER
+)
+from posts.views import POSTS_PER_PAGE, COMMENTS_PER_PAGE
+
+
+User = get_user_model()
+
+
+def feed_requests():
+    """Offset and both cursor directions, the ways a feed is read"""
+    factory = RequestFactory()
+    now = timezone.now()
+    return (
+        factory.get('/', {'page': 2}),
+        factory.get('/', {'cursor': ''}),
+        factory.get('/', {'cursor': encode_cursor(OLDER, now, 1)}),
+        factory.get('/', {'cursor': encode_cursor(NEWER, now, 1)}),
+    )
+
+
+def run_view_queries():
+    """Runs the queries posts views issue, with placeholder ids"""
+    user = User(pk=1)
+    feeds = {
+        'index': (Post.objects.all(), None),
+        'group_posts': (Post.objects.filter(group_id=1), None),
+        'profile': (Post.objects.filter(author_id=1), None),
+        'follow_index': keyed_follow_feed(user),
+    }
+    for post_list, keys in feeds.values():
+        for request in feed_requests():
+            list(create_page_obj(
+                post_list, POSTS_PER_PAGE, request, keys=keys))
+    author_stats(user)
+    Follow.objects.filter(user=user, author_id=2).exists()
+    Follow.objects.filter(author_id=1).values_list('user_id').first()
+    for request in feed_requests():
+        list(create_comments_page(
+            Comment.objects.filter(post_id=1), COMMENTS_PER_PAGE, request))
+
+
+def is_bad_step(detail: str) -> bool:
+    """Full table scan or a sort the indexes do not cover"""
+    return ((detail.startswith('SCAN') and 'INDEX' not in detail)
+            or 'TEMP B-TREE' in detail)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы запросов лент: без полного сканирования '
+            'таблиц и временных сортировок')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite')
+        with CaptureQueriesContext(connection) as context:
+            run_view_queries()
+        failed = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = [row[-1] for row in cursor.fetchall()]
+                if any(is_bad_step(detail) for detail in plan):
+                    failed.append(query['sql'])
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{query["sql"]}\n  {plan}')
+        if failed:
+            raise CommandError(
+                'Запросы без подходящего индекса:\n' + '\n'.join(failed))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {len(context.captured_queries)}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import AuthorStats
+from posts.timeline import demote, demotion_threshold
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает посты авторов, опустившихся ниже порога, '
+            'по лентам подписчиков')
+
+    def handle(self, *args, **options):
+        author_ids = list(AuthorStats.objects.filter(
+            is_celebrity=True,
+            followers_count__lte=demotion_threshold()
+        ).values_list('user_id', flat=True))
+        for author_id in author_ids:
+            demote(author_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты дополнены постами авторов: {len(author_ids)}'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.background import process_pool
+from posts.thumbnails import (
+    missing_thumbnails, prepare_thumbnails, thumbnail_workers
+)
+
+
+class Command(BaseCommand):
+    help = 'Готовит недостающие миниатюры картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов, 0 — без пула'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers is None:
+            workers = thumbnail_workers() or 1
+        post_ids = missing_thumbnails()
+        if workers:
+            with process_pool(workers) as pool:
+                list(pool.map(prepare_thumbnails, post_ids))
+        else:
+            for post_id in post_ids:
+                prepare_thumbnails(post_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры готовы для постов: {len(post_ids)}'))
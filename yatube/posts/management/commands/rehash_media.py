@@ -0,0 +1,63 @@
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.storage import is_hashed
+from posts.feed_cache import SHARED_SCOPE, bump
+from posts.models import Post, PostThumbnail
+from posts.thumbnails import THUMBNAIL_DIR
+
+
+class Command(BaseCommand):
+    help = 'Переименовывает картинки постов и миниатюры по хешу содержимого'
+
+    def rehash(self, name, directory):
+        """Name of the stored copy or None when the file cannot be read"""
+        try:
+            with default_storage.open(name) as source:
+                return default_storage.save(
+                    posixpath.join(directory, posixpath.basename(name)),
+                    source)
+        except (OSError, SuspiciousFileOperation) as error:
+            self.stderr.write(f'Файл {name} не перенесён: {error}')
+            return None
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'reference'):
+            raise CommandError(
+                'Хранилище по умолчанию не адресует файлы по содержимому')
+        moved = 0
+        images = Post.objects.exclude(image='').values_list('pk', 'image')
+        for post_id, name in images:
+            if is_hashed(name):
+                continue
+            new_name = self.rehash(name, Post.image.field.upload_to)
+            if new_name is None:
+                continue
+            with transaction.atomic():
+                # Cards are keyed by modified.
+                Post.objects.filter(pk=post_id).update(
+                    image=new_name, modified=timezone.now())
+                PostThumbnail.objects.filter(source=name).update(
+                    source=new_name)
+                default_storage.delete(name)
+            moved += 1
+        for thumbnail_id, name in PostThumbnail.objects.values_list(
+                'pk', 'name'):
+            if is_hashed(name):
+                continue
+            new_name = self.rehash(name, THUMBNAIL_DIR)
+            if new_name is None:
+                continue
+            with transaction.atomic():
+                PostThumbnail.objects.filter(pk=thumbnail_id).update(
+                    name=new_name)
+                default_storage.delete(name)
+            moved += 1
+        if moved:
+            bump(SHARED_SCOPE)
+        self.stdout.write(self.style.SUCCESS(f'Перенесено файлов: {moved}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import TimelineEntry
+from posts.timeline import trim
+
+
+class Command(BaseCommand):
+    help = 'Обрезает ленты подписок до TIMELINE_MAX_LENGTH записей'
+
+    def handle(self, *args, **options):
+        user_ids = list(TimelineEntry.objects.order_by().values_list(
+            'user_id', flat=True).distinct())
+        for user_id in user_ids:
+            trim(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено лент: {len(user_ids)}'))
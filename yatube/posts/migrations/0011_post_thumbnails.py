@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostThumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходная картинка')),
+                ('geometry', models.CharField(max_length=32, verbose_name='Размер')),
+                ('name', models.CharField(max_length=255, verbose_name='Файл')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Миниатюра',
+                'verbose_name_plural': 'Миниатюры',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postthumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'geometry'), name='unique post thumbnail'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='postthumbnail',
+            name='unique post thumbnail',
+        ),
+        migrations.AddField(
+            model_name='postthumbnail',
+            name='format',
+            field=models.CharField(default='jpeg', max_length=8, verbose_name='Формат'),
+        ),
+        migrations.AddConstraint(
+            model_name='postthumbnail',
+            constraint=models.UniqueConstraint(fields=('post', 'geometry', 'format'), name='unique post thumbnail variant'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+
+
+# Full-text index of post texts and group titles, rowid is the post id.
+# Triggers keep it in sync with writes that bypass signals too.
+
+
+def fold(column):
+    """The tokenizer removes Latin diacritics only, ё is folded here"""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+GROUP_TITLE = fold(
+    '(SELECT title FROM posts_group WHERE id = new.group_id)')
+
+CREATE_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE posts_post_search USING fts5(
+        text, group_title, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO posts_post_search(posts_post_search, rank)
+    VALUES ('rank', 'bm25(1.0, 0.5)')
+    """,
+    f"""
+    CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(rowid, text, group_title)
+        VALUES (new.id, {fold('new.text')}, {GROUP_TITLE});
+    END
+    """,
+    f"""
+    CREATE TRIGGER posts_post_search_update
+    AFTER UPDATE OF text, group_id ON posts_post
+    BEGIN
+        DELETE FROM posts_post_search WHERE rowid = old.id;
+        INSERT INTO posts_post_search(rowid, text, group_title)
+        VALUES (new.id, {fold('new.text')}, {GROUP_TITLE});
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_post_search WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER posts_group_search_update
+    AFTER UPDATE OF title ON posts_group
+    BEGIN
+        UPDATE posts_post_search SET group_title = {fold('new.title')}
+        WHERE rowid IN (SELECT id FROM posts_post WHERE group_id = new.id);
+    END
+    """,
+    f"""
+    INSERT INTO posts_post_search(rowid, text, group_title)
+    SELECT posts_post.id, {fold('posts_post.text')},
+           {fold('posts_group.title')}
+    FROM posts_post
+    LEFT JOIN posts_group ON posts_group.id = posts_post.group_id
+    """,
+]
+
+DROP_SEARCH = [
+    'DROP TRIGGER posts_group_search_update',
+    'DROP TRIGGER posts_post_search_delete',
+    'DROP TRIGGER posts_post_search_update',
+    'DROP TRIGGER posts_post_search_insert',
+    'DROP TABLE posts_post_search',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH, DROP_SEARCH),
+    ]
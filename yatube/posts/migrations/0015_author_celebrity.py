@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_celebrities(apps, schema_editor):
+    """
+    The flag used to live in the cache only. Authors above the lower
+    threshold are marked: merging a fanned-out author at read time is
+    harmless, skipping a merged one loses their posts.
+    """
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    fanout = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 1000)
+    threshold = getattr(settings, 'TIMELINE_DEMOTION_THRESHOLD',
+                        fanout * 4 // 5)
+    AuthorStats.objects.filter(followers_count__gt=threshold).update(
+        is_celebrity=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='is_celebrity',
+            field=models.BooleanField(default=False, verbose_name='Посты подмешиваются при чтении'),
+        ),
+        migrations.RunPython(mark_celebrities, migrations.RunPython.noop),
+    ]
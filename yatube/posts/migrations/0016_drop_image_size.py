@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:31
+
+from importlib import import_module
+
+from django.db import migrations
+
+
+# SQLite rebuilds posts_post to drop columns, the search triggers that
+# name the table are dropped first and the index is built again after.
+search = import_module('posts.migrations.0014_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_author_celebrity'),
+    ]
+
+    operations = [
+        migrations.RunSQL(search.DROP_SEARCH, search.CREATE_SEARCH),
+        migrations.RemoveField(
+            model_name='post',
+            name='image_height',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='image_width',
+        ),
+        migrations.RunSQL(search.CREATE_SEARCH, search.DROP_SEARCH),
+    ]
@@ -1,3 +1,4 @@
+from django.core.files.storage import default_storage
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -28,12 +29,23 @@ class Post(models.Model):
         verbose_name='Дата публикации'
     )
 
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
         blank=True
     )
 
+    image_placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Превью картинки'
+    )
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -51,10 +63,24 @@ class Post(models.Model):
         help_text='Группа, к которой будет относиться пост'
     )
 
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество комментариев'
+    )
+
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -89,6 +115,10 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -112,3 +142,123 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique follow')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество постов'
+    )
+
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписок'
+    )
+
+    is_celebrity = models.BooleanField(
+        default=False,
+        verbose_name='Посты подмешиваются при чтении'
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique timeline entry')
+        ]
+
+
+class PostThumbnail(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnails',
+        verbose_name='Пост'
+    )
+
+    source = models.CharField(
+        max_length=255,
+        verbose_name='Исходная картинка'
+    )
+
+    geometry = models.CharField(
+        max_length=32,
+        verbose_name='Размер'
+    )
+
+    format = models.CharField(
+        max_length=8,
+        default='jpeg',
+        verbose_name='Формат'
+    )
+
+    name = models.CharField(
+        max_length=255,
+        verbose_name='Файл'
+    )
+
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+
+    height = models.PositiveIntegerField(verbose_name='Высота')
+
+    class Meta:
+        verbose_name = 'Миниатюра'
+        verbose_name_plural = 'Миниатюры'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'geometry', 'format'],
+                name='unique post thumbnail variant')
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
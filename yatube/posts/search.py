@@ -0,0 +1,61 @@
+import re
+
+from django.db import connection, transaction
+
+from .models import Post
+
+
+SEARCH_TABLE = 'posts_post_search'
+# Words of the query; FTS5 operators and quotes typed by users are not
+# interpreted.
+TERM = re.compile(r'\w+')
+
+
+def fold(column: str) -> str:
+    """
+    SQL folding ё to е, the tokenizer removes Latin diacritics only;
+    the triggers of the 0014 migration index folded text as well.
+    """
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def match_expression(query: str) -> str:
+    """FTS5 query matching posts with every word, the last as a prefix"""
+    terms = TERM.findall(query.replace('ё', 'е').replace('Ё', 'Е'))
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_posts(queryset, query: str):
+    """Posts of the queryset matching the query, best ranked first"""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[f'{SEARCH_TABLE}.rowid = {Post._meta.db_table}.id',
+               f'{SEARCH_TABLE} MATCH %s'],
+        params=[expression],
+        select={'search_rank': f'{SEARCH_TABLE}.rank'},
+        order_by=['search_rank', '-pub_date'],
+    )
+
+
+def rebuild() -> int:
+    """Refills the index from the posts table, returns its size"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(f"""
+            INSERT INTO {SEARCH_TABLE}(rowid, text, group_title)
+            SELECT posts_post.id, {fold('posts_post.text')},
+                   {fold('posts_group.title')}
+            FROM posts_post
+            LEFT JOIN posts_group ON posts_group.id = posts_post.group_id
+        """)
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,247 @@
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from core.proxy import purge, purge_enabled
+from .models import Post, PostThumbnail, Group, Comment, Follow, User
+from . import (
+    counters, feed_cache, follow_set, lookups, surrogate, thumbnails,
+    timeline
+)
+
+
+RENDERED_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_author(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_author(instance.author_id, 'followers_count', 1)
+        counters.bump_author(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.bump_author(instance.author_id, 'followers_count', -1)
+    counters.bump_author(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.forget_recent_posts(instance.author_id)
+        if timeline.fan_out(instance):
+            timeline.schedule_trim(instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_post(sender, instance, **kwargs):
+    timeline.forget_recent_posts(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def remember_follow(sender, instance, created, **kwargs):
+    if created:
+        follow_set.forget_followed(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def forget_follow(sender, instance, **kwargs):
+    follow_set.forget_followed(instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and not timeline.update_celebrity(instance.author_id):
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+    timeline.update_celebrity(instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_feeds(sender, instance, **kwargs):
+    old = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'author_id', 'image').first()
+    instance._old_image = old[2] if old is not None else ''
+    old = old[:2] if old is not None else None
+    instance._old_feed_scopes = (
+        feed_cache.post_scopes(*old) if old is not None else [])
+    if old is not None and purge_enabled():
+        instance._old_surrogate_keys = surrogate.post_write_keys(
+            instance.pk, *old)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_feeds(sender, instance, **kwargs):
+    scopes = feed_cache.post_scopes(instance.group_id, instance.author_id)
+    scopes += getattr(instance, '_old_feed_scopes', [])
+    scopes.append(feed_cache.post_scope(instance.pk))
+    feed_cache.bump(*set(scopes))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_commented_post(sender, instance, **kwargs):
+    feed_cache.bump(feed_cache.post_scope(instance.post_id))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._old_slug = Group.objects.filter(pk=instance.pk).values_list(
+        'slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_feeds(sender, instance, **kwargs):
+    scopes = {feed_cache.index_scope(), feed_cache.group_scope(instance.slug)}
+    if kwargs.get('signal') is post_delete:
+        scopes.add(feed_cache.SHARED_SCOPE)
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug is not None:
+        scopes.add(feed_cache.group_scope(old_slug))
+    feed_cache.bump(*scopes)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields=None, **kwargs):
+    instance._old_names = None
+    if instance.pk is None:
+        return
+    if update_fields and not RENDERED_USER_FIELDS & set(update_fields):
+        return
+    instance._old_names = User.objects.filter(pk=instance.pk).values(
+        *RENDERED_USER_FIELDS).first()
+
+
+def names_changed(instance) -> bool:
+    """Whether the save changed what pages show of the user"""
+    old = getattr(instance, '_old_names', None)
+    return old is not None and any(
+        getattr(instance, field) != value for field, value in old.items())
+
+
+@receiver(post_save, sender=User)
+def bump_author_feeds(sender, instance, **kwargs):
+    if not names_changed(instance):
+        return
+    scopes = feed_cache.author_feed_scopes(instance.pk)
+    scopes.append(feed_cache.author_scope(instance._old_names['username']))
+    feed_cache.bump(*set(scopes))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_followed_profile(sender, instance, **kwargs):
+    feed_cache.bump(*feed_cache.author_scopes(instance.author_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    if not purge_enabled():
+        return
+    keys = surrogate.post_write_keys(
+        instance.pk, instance.group_id, instance.author_id)
+    purge(*keys, *getattr(instance, '_old_surrogate_keys', []))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_commented_post(sender, instance, **kwargs):
+    purge(surrogate.post_page_key(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    keys = [surrogate.group_key(instance.slug)]
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug is not None:
+        keys.append(surrogate.group_key(old_slug))
+    purge(*keys)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_followed_profile(sender, instance, **kwargs):
+    purge(surrogate.profile_key(instance.author_id))
+
+
+@receiver(post_save, sender=User)
+def purge_author_pages(sender, instance, **kwargs):
+    if not names_changed(instance):
+        return
+    purge(surrogate.author_key(instance.pk))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group_lookups(sender, **kwargs):
+    lookups.group_by_slug.invalidate(sender, **kwargs)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_lookups(sender, **kwargs):
+    lookups.user_by_username.invalidate(sender, **kwargs)
+
+
+@receiver(pre_save, sender=Post)
+def preview_new_image(sender, instance, **kwargs):
+    if not instance.image:
+        instance.image_placeholder = ''
+    elif not instance.image._committed:
+        thumbnails.preview_upload(instance)
+
+
+@receiver(post_save, sender=Post)
+def prepare_post_thumbnails(sender, instance, **kwargs):
+    if instance.image and instance.image.name != getattr(
+            instance, '_old_image', ''):
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    old_image = getattr(instance, '_old_image', '')
+    if old_image and old_image != instance.image.name:
+        instance.image.storage.delete(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+
+
+@receiver(post_delete, sender=PostThumbnail)
+def release_thumbnail(sender, instance, **kwargs):
+    default_storage.delete(instance.name)
@@ -0,0 +1,50 @@
+from urllib.parse import quote
+
+from .models import Group
+
+
+INDEX_KEY = 'feed-index'
+
+
+def post_key(post_id: int) -> str:
+    return f'post-{post_id}'
+
+
+def post_page_key(post_id: int) -> str:
+    """The post page alone: comments are shown nowhere else"""
+    return f'post-page-{post_id}'
+
+
+def author_key(author_id: int) -> str:
+    return f'author-{author_id}'
+
+
+def profile_key(author_id: int) -> str:
+    """The profile page alone: follows change nothing on the feeds"""
+    return f'profile-{author_id}'
+
+
+def group_key(slug: str) -> str:
+    return f'group-{quote(slug)}'
+
+
+def card_keys(post) -> list:
+    """Keys of everything a post card shows"""
+    keys = [post_key(post.pk), author_key(post.author_id)]
+    if post.group is not None:
+        keys.append(group_key(post.group.slug))
+    return keys
+
+
+def page_keys(posts) -> list:
+    return [key for post in posts for key in card_keys(post)]
+
+
+def post_write_keys(post_id, group_id, author_id) -> list:
+    """Keys of the pages a post with the given group and author is on"""
+    keys = [INDEX_KEY, post_key(post_id), author_key(author_id)]
+    slug = Group.objects.filter(pk=group_id).values_list(
+        'slug', flat=True).first()
+    if slug is not None:
+        keys.append(group_key(slug))
+    return keys
@@ -0,0 +1,50 @@
+from django import template
+
+from posts.cards import render_cards
+from posts.thumbnails import GEOMETRY, parse_geometry, prepared_variants
+
+
+register = template.Library()
+
+# Feed images span the content column up to the frame width.
+DEFAULT_SIZES = '(max-width: 992px) 100vw, 960px'
+
+
+@register.simple_tag
+def post_cards(posts):
+    return render_cards(posts)
+
+
+def srcset(variants) -> str:
+    return ', '.join(f'{variant.url} {variant.width}w' for variant in variants)
+
+
+@register.simple_tag
+def placeholder_style(post) -> str:
+    """Inline blurred preview shown until the image itself arrives"""
+    if not post.image_placeholder:
+        return ''
+    return (f'background: url({post.image_placeholder}) center / cover '
+            'no-repeat')
+
+
+@register.inclusion_tag('includes/post_image.html')
+def responsive_image(post, sizes=DEFAULT_SIZES):
+    """
+    Picture with WebP and JPEG srcsets of the prepared variants, or a
+    placeholder of the same ratio while they are being prepared.
+    """
+    variants = prepared_variants(post)
+    jpegs = [variant for variant in variants if variant.format == 'jpeg']
+    webps = [variant for variant in variants if variant.format == 'webp']
+    width, height = parse_geometry(GEOMETRY)
+    return {
+        'has_image': bool(post.image),
+        'image': jpegs[-1] if jpegs else None,
+        'jpeg_srcset': srcset(jpegs),
+        'webp_srcset': srcset(webps),
+        'sizes': sizes,
+        'placeholder': placeholder_style(post),
+        'width': width,
+        'height': height,
+    }
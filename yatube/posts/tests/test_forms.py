@@ -1,4 +1,5 @@
 from http import HTTPStatus
+from io import BytesIO
 import shutil
 import tempfile
 
@@ -8,7 +9,9 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from PIL import Image
 
+from ..forms import PostForm
 from ..models import Post, Comment
 
 
@@ -208,3 +211,59 @@ class PostCreateFormTest(TestCase):
         self.assertFalse(
             Comment.objects.filter(text=form_data['text']).exists())
         self.assertEqual(Comment.objects.count(), comments_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=150)
+class ImageIngestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def upload(self, name, mode, size, format_, **options):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, format_, **options)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def submit(self, upload):
+        form = PostForm(data={'text': 'Фото'}, files={'image': upload})
+        if form.is_valid():
+            form.instance.author = self.user
+            form.save()
+        return form
+
+    @override_settings(IMAGE_MAX_PIXELS=100 * 100)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с большим числом пикселей отклоняется."""
+        form = self.submit(self.upload('huge.png', 'L', (101, 100), 'PNG'))
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'image_too_large')
+
+    def test_photo_is_upright_small_and_clean(self):
+        """Фото поворачивается по EXIF, уменьшается и теряет метаданные."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Камера'
+        form = self.submit(self.upload(
+            'photo.jpeg', 'RGB', (300, 200), 'JPEG', exif=exif))
+
+        with form.instance.image.open() as stored, Image.open(stored) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 150))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertTrue(form.instance.image.name.endswith('.jpg'))
+
+    def test_transparent_image_stays_png(self):
+        """Прозрачная картинка сохраняется в PNG."""
+        form = self.submit(self.upload('logo.gif', 'RGBA', (50, 50), 'PNG'))
+
+        with form.instance.image.open() as stored, Image.open(stored) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(image.size, (50, 50))
@@ -1,7 +1,14 @@
+from io import StringIO
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import Http404
 
-from ..models import Group, Post
+from ..counters import author_stats
+from ..lookups import group_by_slug, user_by_username
+from ..models import Group, Post, Comment, Follow, AuthorStats
 
 
 User = get_user_model()
@@ -63,3 +70,103 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счетчики обновляются при создании и удалении объектов."""
+        comment = Comment.objects.create(
+            text='Комментарий', author=self.reader, post=self.post)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+
+        self.assertEqual(author_stats(self.author).posts_count, 1)
+        self.assertEqual(author_stats(self.author).followers_count, 1)
+        self.assertEqual(author_stats(self.reader).following_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+
+        comment.delete()
+        follow.delete()
+        self.post.refresh_from_db()
+
+        self.assertEqual(author_stats(self.author).followers_count, 0)
+        self.assertEqual(author_stats(self.reader).following_count, 0)
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_recount_repairs_counters(self):
+        """Команда recount_counters восстанавливает счетчики."""
+        AuthorStats.objects.all().delete()
+        Post.objects.update(comments_count=5)
+        Comment.objects.create(
+            text='Комментарий', author=self.reader, post=self.post)
+
+        call_command('recount_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertEqual(author_stats(self.author).posts_count, 1)
+        self.assertEqual(author_stats(self.reader).posts_count, 0)
+        self.assertEqual(self.post.comments_count, 1)
+
+
+class LookupsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа', slug='lookup-group', description='Описание')
+        cls.user = User.objects.create(username='lookup_user')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_lookup_skips_db(self):
+        """Повторный поиск группы и пользователя не обращается к базе."""
+        group_by_slug.get(self.group.slug)
+        user_by_username.get(self.user.username)
+
+        with self.assertNumQueries(0):
+            group = group_by_slug.get(self.group.slug)
+            user = user_by_username.get(self.user.username)
+
+        self.assertEqual(group, self.group)
+        self.assertEqual(user, self.user)
+        self.assertIsNot(group, group_by_slug.get(self.group.slug))
+
+    def test_unknown_values_are_remembered(self):
+        """Неизвестное имя запоминается, пока пользователь не появится."""
+        self.assertIsNone(user_by_username.get('nobody'))
+        with self.assertNumQueries(0):
+            with self.assertRaises(Http404):
+                user_by_username.get_or_404('nobody')
+
+        nobody = User.objects.create(username='nobody')
+
+        self.assertEqual(user_by_username.get('nobody'), nobody)
+
+    def test_writes_invalidate_lookups(self):
+        """Изменение группы сбрасывает запомненные значения."""
+        group_by_slug.get(self.group.slug)
+        Group.objects.filter(pk=self.group.pk).update(slug='silent')
+        self.assertEqual(group_by_slug.get(self.group.slug), self.group)
+
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+
+        self.assertIsNone(group_by_slug.get(self.group.slug))
+        self.assertEqual(group_by_slug.get('renamed'), self.group)
+
+    def test_login_keeps_lookups(self):
+        """Вход пользователя не сбрасывает запомненных пользователей."""
+        user_by_username.get(self.user.username)
+        self.user.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            user_by_username.get(self.user.username)
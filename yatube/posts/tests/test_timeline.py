@@ -0,0 +1,251 @@
+from array import array
+from io import StringIO
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+
+from ..follow_set import (
+    FOLLOW_SET_KEY, TYPECODE, _generation, followed_ids, is_following
+)
+from .. import timeline
+from ..models import Post, Follow, TimelineEntry
+from ..timeline import (
+    TIMELINE_KEYS, celebrity_ids, demote, follow_feed, trim_followers
+)
+from ..utils import CursorPaginator
+
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.old_posts = [
+            Post.objects.create(text=f'Старый пост {num}', author=cls.author)
+            for num in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def timeline_posts(self):
+        return list(Post.objects.filter(timeline_entries__user=self.reader))
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+
+        self.assertEqual(self.timeline_posts(), self.old_posts[::-1])
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+
+        self.assertEqual(self.timeline_posts()[0], new_post)
+
+    def test_unfollow_removes_author_posts(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_backfill_trims_timeline(self):
+        """Лента не превышает TIMELINE_MAX_LENGTH записей."""
+        Follow.objects.create(user=self.reader, author=self.author)
+
+        self.assertEqual(self.timeline_posts(), self.old_posts[:0:-1])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2, TIMELINE_WORKERS=1)
+    def test_fan_out_trims_timeline_in_pool(self):
+        """Новый пост вытесняет старую запись ленты в пуле."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with mock.patch.object(timeline.pool, 'submit') as submit, \
+                mock.patch('django.db.transaction.on_commit',
+                           side_effect=lambda func: func()):
+            new_post = Post.objects.create(
+                text='Новый пост', author=self.author)
+
+        submit.assert_called_once_with(trim_followers, self.author.pk)
+        trim_followers(self.author.pk)
+        self.assertEqual(self.timeline_posts(),
+                         [new_post, self.old_posts[2]])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_command_trims_timelines(self):
+        """Без пула ленты обрезает команда."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+
+        call_command('trim_timelines', stdout=StringIO())
+
+        self.assertEqual(self.timeline_posts(),
+                         [new_post, self.old_posts[2]])
+
+    def test_cursor_seeks_on_timeline(self):
+        """Курсор ленты подписок ищет по колонкам самой ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        paginator = CursorPaginator(
+            follow_feed(self.reader), 2, keys=TIMELINE_KEYS)
+        first = paginator.get_page(None)
+
+        with CaptureQueriesContext(connection) as context:
+            second = paginator.get_page(first.next_cursor())
+
+        self.assertEqual(list(second), self.old_posts[:1])
+        sql = context.captured_queries[0]['sql']
+        self.assertEqual(sql.count('JOIN'), 1)
+        self.assertIn('"posts_timelineentry"."pub_date" <=', sql)
+
+
+@override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+class HybridTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.celebrity = User.objects.create(username='celebrity')
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.fan = User.objects.create(username='fan')
+
+    def setUp(self):
+        cache.clear()
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        Follow.objects.create(user=self.reader, author=self.celebrity)
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_celebrity_posts_are_not_fanned_out(self):
+        """Посты популярного автора не раскладываются по лентам."""
+        Post.objects.create(text='Пост звезды', author=self.celebrity)
+
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__author=self.celebrity).exists())
+
+    def test_follow_feed_merges_celebrity_posts(self):
+        """Лента подписок подмешивает посты популярных авторов."""
+        first = Post.objects.create(text='Первый', author=self.author)
+        second = Post.objects.create(text='Второй', author=self.celebrity)
+        third = Post.objects.create(text='Третий', author=self.author)
+
+        self.assertEqual(list(follow_feed(self.reader)),
+                         [third, second, first])
+
+    @override_settings(TIMELINE_WORKERS=1)
+    def test_author_below_threshold_is_backfilled(self):
+        """После отписки от звезды ее посты раскладываются по лентам."""
+        post = Post.objects.create(text='Пост звезды', author=self.celebrity)
+
+        def run_inline(task, *args):
+            task(*args)
+            return True
+
+        with mock.patch.object(timeline.pool, 'submit', run_inline), \
+                mock.patch('django.db.transaction.on_commit',
+                           side_effect=lambda func: func()):
+            Follow.objects.filter(user=self.fan).delete()
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+
+    @override_settings(TIMELINE_DEMOTION_THRESHOLD=0)
+    def test_author_between_thresholds_stays_merged(self):
+        """Между порогами автор остается звездой, ленты не дополняются."""
+        post = Post.objects.create(text='Пост звезды', author=self.celebrity)
+        Follow.objects.filter(user=self.fan).delete()
+
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertIn(post, follow_feed(self.reader))
+
+    @override_settings(TIMELINE_DEMOTION_THRESHOLD=0)
+    def test_celebrity_flag_survives_cache_loss(self):
+        """Потеря кэша не возвращает автора между порогами в раскладку."""
+        post = Post.objects.create(text='Пост звезды', author=self.celebrity)
+        Follow.objects.filter(user=self.fan).delete()
+        cache.clear()
+
+        self.assertEqual(celebrity_ids([self.celebrity.pk]),
+                         [self.celebrity.pk])
+        self.assertIn(post, follow_feed(self.reader))
+
+    @override_settings(TIMELINE_WORKERS=1)
+    def test_demotion_left_to_pool(self):
+        """Ленты подписчиков дополняются в пуле, а не в запросе отписки."""
+        post = Post.objects.create(text='Пост звезды', author=self.celebrity)
+        with mock.patch.object(timeline.pool, 'submit') as submit, \
+                mock.patch('django.db.transaction.on_commit',
+                           side_effect=lambda func: func()):
+            Follow.objects.filter(user=self.fan).delete()
+
+        submit.assert_called_once_with(demote, self.celebrity.pk)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertIn(post, follow_feed(self.reader))
+
+    def test_command_demotes_skipped_authors(self):
+        """Команда дополняет ленты, если задача не попала в очередь."""
+        post = Post.objects.create(text='Пост звезды', author=self.celebrity)
+        Follow.objects.filter(user=self.fan).delete()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+        call_command('demote_celebrities', stdout=StringIO())
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+
+
+class FollowSetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='set_reader')
+        cls.authors = [
+            User.objects.create(username=f'set_author_{num}')
+            for num in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_follows_update_set(self):
+        """Подписки и отписки меняют кэшированный набор авторов."""
+        for author in reversed(self.authors):
+            Follow.objects.create(user=self.reader, author=author)
+        Follow.objects.filter(author=self.authors[1]).delete()
+        followed_ids(self.reader.pk)
+
+        with self.assertNumQueries(0):
+            ids = list(followed_ids(self.reader.pk))
+            following = [is_following(self.reader.pk, author.pk)
+                         for author in self.authors]
+
+        self.assertEqual(ids, [self.authors[0].pk, self.authors[2].pk])
+        self.assertEqual(following, [True, False, True])
+
+    def test_set_read_before_write_is_not_kept(self):
+        """Набор, прочитанный до записи подписки, не переживает её."""
+        generation = _generation(self.reader.pk)
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        # Другой процесс дописывает набор, прочитанный до подписки.
+        cache.set(FOLLOW_SET_KEY.format(self.reader.pk),
+                  (generation, array(TYPECODE).tobytes()), None)
+
+        self.assertTrue(is_following(self.reader.pk, self.authors[0].pk))
+
+    def test_set_rebuilt_from_db(self):
+        """Пропавший из кэша набор собирается заново из подписок."""
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        cache.clear()
+
+        self.assertTrue(is_following(self.reader.pk, self.authors[0].pk))
+        self.assertFalse(is_following(self.reader.pk, self.authors[1].pk))
@@ -50,6 +50,7 @@ class PostsURLTests(TestCase):
         cls.group_list_url = f'/group/{cls.group.slug}/'
         cls.profile_url = f'/profile/{cls.author.username}/'
         cls.post_detail_url = f'/posts/{cls.post.pk}/'
+        cls.search_url = '/search/?q=пост'
 
     @classmethod
     def tearDownClass(cls):
@@ -71,6 +72,7 @@ class PostsURLTests(TestCase):
             self.index_url, self.group_list_url,
             self.profile_url,
             self.post_detail_url,
+            self.search_url,
         )
 
         for url in desired_locations:
@@ -133,7 +135,8 @@ class PostsURLTests(TestCase):
             self.profile_url: 'posts/profile.html',
             self.post_detail_url: 'posts/post_detail.html',
             self.post_edit_url: 'posts/post_create.html',
-            self.post_create_url: 'posts/post_create.html'
+            self.post_create_url: 'posts/post_create.html',
+            self.search_url: 'posts/search.html',
         }
 
         for address, template in templates_url_names.items():
@@ -1,16 +1,44 @@
+from datetime import timedelta
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 import shutil
 import tempfile
+import threading
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.http import HttpResponse
+from django.test import (
+    Client, LiveServerTestCase, RequestFactory, TestCase, override_settings
+)
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from core.cache_access import acquire, wrap
+from core.models import StoredFile
+from core.query_budget import (
+    QueryBudgetExceeded, assert_max_queries, off_budget
+)
+from core.storage import is_hashed
+from core.views import received_purges
 from ..models import Post, Group, Comment, Follow
+from ..cards import render_cards
+from ..feed_cache import (
+    SHARED_SCOPE, get_versions, index_scope, learning_key
+)
+from ..utils import (
+    NEWER, OLDER, CursorPaginator, encode_cursor, page_window
+)
+from ..views import COMMENTS_PER_PAGE
 
 
 User = get_user_model()
@@ -220,7 +248,7 @@ class PostsPagesTest(TestCase):
         )
         response_before_cache = self.authorized_client.get(
             reverse(self.index))
-        new_post.delete()
+        Post.objects.filter(pk=new_post.pk).update(text='Без сигналов')
         response_cached = self.authorized_client.get(reverse(self.index))
         cache.clear()
         response_empty_cache = self.authorized_client.get(reverse(self.index))
@@ -230,6 +258,59 @@ class PostsPagesTest(TestCase):
         self.assertNotEqual(response_before_cache.content,
                             response_empty_cache.content)
 
+    def test_cache_invalidated_by_writes(self):
+        """Запись поста сбрасывает кэш только затронутых лент."""
+        other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-group',
+            description='Описание'
+        )
+        urls = {
+            'index': reverse(self.index),
+            'group': reverse(self.group_list, args=[self.group.slug]),
+            'other_group': reverse(self.group_list, args=[other_group.slug]),
+            'profile': reverse(self.profile, args=[self.author.username]),
+        }
+        before = {name: self.authorized_client.get(url).content
+                  for name, url in urls.items()}
+
+        Post.objects.create(
+            text='Новый пост в группе', author=self.author, group=self.group)
+        after = {name: self.authorized_client.get(url)
+                 for name, url in urls.items()}
+
+        for name in ('index', 'group', 'profile'):
+            with self.subTest(name=name):
+                self.assertContains(after[name], 'Новый пост в группе')
+        self.assertEqual(after['other_group'].content, before['other_group'])
+        self.assertNotIn('page_obj', after['other_group'].context)
+
+    def test_stale_page_served_while_recomputed(self):
+        """Пока другой процесс перерисовывает ленту, отдаётся старая копия."""
+        url = reverse(self.index)
+        before = self.authorized_client.get(url).content
+        Post.objects.create(text='Пост во время пересчёта', author=self.author)
+
+        with mock.patch('core.cache_access.acquire', return_value=False):
+            stale = self.authorized_client.get(url)
+        fresh = self.authorized_client.get(url)
+
+        self.assertEqual(stale.content, before)
+        self.assertContains(fresh, 'Пост во время пересчёта')
+
+    def test_stale_page_has_no_etag(self):
+        """Старая копия не получает ETag новой версии ленты."""
+        url = reverse(self.index)
+        self.authorized_client.get(url)
+        Post.objects.create(text='Пост во время пересчёта', author=self.author)
+
+        with mock.patch('core.cache_access.acquire', return_value=False):
+            stale = self.authorized_client.get(url)
+        fresh = self.authorized_client.get(url)
+
+        self.assertFalse(stale.has_header('ETag'))
+        self.assertTrue(fresh.has_header('ETag'))
+
     def test_profile_follow_and_unfollow(self):
         """Пользователь может подписываться."""
         count_follows = Follow.objects.count()
@@ -333,3 +414,799 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(
                     len(response.context['page_obj']),
                     self.second_page_posts)
+
+    def test_cursor_pages_walk_through_feed(self):
+        """Курсорный паджинатор проходит ленту вперед и назад."""
+        pages = (
+            self.index,
+            self.group_list,
+            self.profile,
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                first = self.authorized_client.get(
+                    page + '?cursor=').context['page_obj']
+                self.assertEqual(len(first), settings.POSTS_PER_PAGE)
+                self.assertFalse(first.has_previous())
+                self.assertTrue(first.has_next())
+
+                second = self.authorized_client.get(
+                    page + f'?cursor={first.next_cursor()}'
+                ).context['page_obj']
+                self.assertEqual(len(second), self.second_page_posts)
+                self.assertFalse(second.has_next())
+
+                back = self.authorized_client.get(
+                    page + f'?cursor={second.previous_cursor()}'
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_cursor_past_the_end_links_to_first_page(self):
+        """Курсор за пределами ленты отдает пустую страницу со ссылкой."""
+        past = timezone.now() - timedelta(days=365 * 10)
+        future = timezone.now() + timedelta(days=365)
+        cursors = (
+            encode_cursor(OLDER, past, 1),
+            encode_cursor(NEWER, future, 1),
+        )
+        for cursor in cursors:
+            for page in (self.index, self.profile):
+                with self.subTest(cursor=cursor, page=page):
+                    response = self.authorized_client.get(
+                        page, {'cursor': cursor})
+
+                    self.assertEqual(len(response.context['page_obj']), 0)
+                    self.assertContains(response, 'href="?cursor="')
+
+    def test_cursor_ignores_queryset_ordering(self):
+        """Курсор ищет по дате и id, а не по сортировке запроса."""
+        paginator = CursorPaginator(Post.objects.order_by('-pub_date', 'text'),
+                                    settings.POSTS_PER_PAGE)
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor())
+
+        self.assertEqual(list(first) + list(second),
+                         list(Post.objects.order_by('-pub_date', '-pk')))
+
+    def test_cursor_broken_token_returns_first_page(self):
+        """Некорректный курсор отдает первую страницу."""
+        response = self.authorized_client.get(self.index + '?cursor=broken')
+
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_PER_PAGE)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class QueryPlansTest(TestCase):
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы целиком и не сортируют."""
+        out = StringIO()
+
+        call_command('check_query_plans', stdout=out)
+
+        self.assertIn('Проверено запросов', out.getvalue())
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Название',
+            slug='budget-slug',
+            description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for post_num in range(settings.POSTS_PER_PAGE + 5):
+            cls.post = Post.objects.create(
+                text=f'Текст {post_num}',
+                author=cls.author,
+                group=cls.group)
+            for commentator in (cls.author, cls.reader):
+                Comment.objects.create(
+                    text='Комментарий', author=commentator, post=cls.post)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def test_pages_fit_query_budget(self):
+        """Число запросов страниц не зависит от числа постов на них."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:follow_index'),
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                with assert_max_queries(8, page):
+                    response = self.authorized_client.get(page)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 1})
+    def test_middleware_raises_over_budget(self):
+        """Middleware падает, если страница превышает лимит запросов."""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.authorized_client.get(reverse('posts:index'))
+
+    def test_background_work_is_counted_apart(self):
+        """Фоновая работа, выполненная на месте, не входит в лимит."""
+        with assert_max_queries(1) as counter:
+            Post.objects.count()
+            with off_budget():
+                Post.objects.count()
+                Comment.objects.count()
+
+        self.assertEqual(len(counter), 1)
+        self.assertEqual(counter.background, 2)
+
+
+class PageWindowTest(TestCase):
+    def window(self, number, count=500):
+        page_obj = Paginator(range(count), 10).page(number)
+        return page_window(page_obj)
+
+    def test_page_window(self):
+        """Паджинатор показывает окно страниц вокруг текущей."""
+        cases = {
+            1: [1, 2, 3, 4, None, 50],
+            10: [1, None, 7, 8, 9, 10, 11, 12, 13, None, 50],
+            47: [1, None, 44, 45, 46, 47, 48, 49, 50],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(self.window(number), expected)
+
+    def test_short_page_range_is_not_elided(self):
+        """Короткий список страниц выводится целиком."""
+        self.assertEqual(self.window(3, count=50), [1, 2, 3, 4, 5])
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='commentator')
+        cls.post = Post.objects.create(text='Текст', author=cls.user)
+        cls.extra_comments = 5
+        for num in range(COMMENTS_PER_PAGE + cls.extra_comments):
+            Comment.objects.create(
+                text=f'Комментарий {num}', author=cls.user, post=cls.post)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_post_detail_shows_first_comments(self):
+        """На странице поста выводится только первая порция комментариев."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        comments = response.context['comments']
+
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertTrue(comments.has_next())
+        self.assertEqual(comments[0].text,
+                         f'Комментарий {COMMENTS_PER_PAGE + 4}')
+
+    def test_more_comments_endpoint(self):
+        """Следующая порция комментариев отдается отдельным фрагментом."""
+        first = self.guest_client.get(reverse(
+            'posts:post_detail', args=[self.post.pk])).context['comments']
+
+        response = self.guest_client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'cursor': first.next_cursor()})
+
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(len(response.context['comments']),
+                         self.extra_comments)
+        self.assertFalse(response.context['comments'].has_next())
+        self.assertContains(response, 'Комментарий 0')
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='card_author')
+        cls.group = Group.objects.create(
+            title='Название',
+            slug='card-slug',
+            description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Исходный текст', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_card_rendered_once_for_all_feeds(self):
+        """Карточка поста из кэша переиспользуется на других лентах."""
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+
+        response = self.guest_client.get(
+            reverse('posts:group_list', args=[self.group.slug]))
+
+        self.assertContains(response, 'Исходный текст')
+
+    def test_edited_post_card_is_rendered_again(self):
+        """Изменение поста обновляет его карточку."""
+        self.guest_client.get(reverse('posts:index'))
+        self.post.text = 'Новый текст'
+        self.post.save()
+
+        response = self.guest_client.get(
+            reverse('posts:group_list', args=[self.group.slug]))
+
+        self.assertContains(response, 'Новый текст')
+
+    def test_cards_fetched_in_one_round_trip(self):
+        """Карточки страницы запрашиваются из кэша одним обращением."""
+        posts = Post.objects.select_related('author', 'group')
+        render_cards(posts)
+
+        with mock.patch.object(cache, 'get_many',
+                               wraps=cache.get_many) as get_many:
+            render_cards(posts)
+
+        get_many.assert_called_once()
+
+
+class SharedPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='shared_author')
+        cls.reader = User.objects.create(username='shared_reader')
+        cls.post = Post.objects.create(text='Текст', author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def test_users_share_cached_page(self):
+        """Страница, закэшированная для гостя, отдается пользователям."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.guest_client.get(url)
+
+        response = self.author_client.get(url)
+
+        self.assertNotIn('post', response.context)
+        self.assertContains(response, 'Пользователь: shared_author')
+        self.assertContains(
+            response, reverse('posts:post_edit', args=[self.post.pk]))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, '<!--hole:')
+
+    def test_user_fragments_not_leaked(self):
+        """Персональные фрагменты не попадают другим пользователям."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:profile', args=[self.author.username])
+        self.author_client.get(url)
+
+        guest_response = self.guest_client.get(url)
+        reader_response = self.reader_client.get(url)
+
+        self.assertNotIn('page_obj', reader_response.context)
+        self.assertNotContains(guest_response, 'Пользователь: shared_author')
+        self.assertNotContains(guest_response, 'Подписаться')
+        self.assertContains(reader_response, 'Пользователь: shared_reader')
+        self.assertContains(reader_response, 'Отписаться')
+
+    def test_rename_refreshes_author_pages_only(self):
+        """Смена имени автора сбрасывает только страницы с этим именем."""
+        other = User.objects.create(username='shared_other')
+        other_post = Post.objects.create(text='Чужой', author=other)
+        index = reverse('posts:index')
+        other_url = reverse('posts:post_detail', args=[other_post.pk])
+        self.guest_client.get(index)
+        self.guest_client.get(other_url)
+
+        author = User.objects.get(pk=self.author.pk)
+        author.set_password('new-password')
+        author.save()
+        self.assertNotIn('page_obj', self.guest_client.get(index).context)
+
+        author.first_name = 'Новое'
+        author.save()
+        self.assertContains(self.guest_client.get(index), 'Новое')
+        self.assertNotIn('post', self.guest_client.get(other_url).context)
+
+    def test_rename_bumps_scopes_in_one_write(self):
+        """Все области автора сбрасываются одной записью в кэш."""
+        for num in range(3):
+            Post.objects.create(text=f'Пост {num}', author=self.author)
+        author = User.objects.get(pk=self.author.pk)
+        author.last_name = 'Новая'
+
+        with mock.patch.object(cache, 'set_many',
+                               wraps=cache.set_many) as set_many:
+            author.save()
+
+        bumps = [args[0] for args, _ in set_many.call_args_list
+                 if any(key.startswith('feed:version:') for key in args[0])]
+        self.assertEqual(len(bumps), 1)
+        self.assertEqual(len(bumps[0]), 6)
+
+    def test_cold_page_rendered_by_one_worker(self):
+        """Без выученного ключа страницу рисует один процесс."""
+        url = reverse('posts:index')
+        versions = tuple(get_versions([index_scope(), SHARED_SCOPE]))
+        key = learning_key(RequestFactory().get(url), 'feed:index.shared')
+        self.assertTrue(acquire(key))
+
+        def other_worker_renders():
+            cache.set(key, wrap(HttpResponse('Страница другого процесса'),
+                                60, versions))
+
+        timer = threading.Timer(0.1, other_worker_renders)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        response = self.guest_client.get(url)
+
+        self.assertContains(response, 'Страница другого процесса')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='etag_author')
+        cls.post = Post.objects.create(text='Текст', author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        cache.clear()
+
+    def revalidate(self, client, url):
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_page_not_modified(self):
+        """Неизменившаяся страница отдается как 304 без запроса ленты."""
+        # Странице поста нужен автор: от него зависит счетчик постов.
+        urls = {
+            reverse('posts:index'): 0,
+            reverse('posts:profile', args=[self.author.username]): 0,
+            reverse('posts:post_detail', args=[self.post.pk]): 1,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with self.assertNumQueries(queries):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response.content, b'')
+
+    def test_login_changes_etag(self):
+        """Новый вход меняет ETag: формы на странице несут новый CSRF-токен."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        User.objects.create_user(username='etag_reader', password='secret')
+        credentials = {'username': 'etag_reader', 'password': 'secret'}
+        client = Client()
+        client.post(reverse('users:login'), credentials)
+        etag = client.get(url)['ETag']
+
+        client.logout()
+        client.post(reverse('users:login'), credentials)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_any_etag_does_not_hide_missing_pages(self):
+        """If-None-Match: * не превращает 404 в 304."""
+        response = self.guest_client.get(
+            reverse('posts:group_list', args=['missing']),
+            HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_write_changes_etag(self):
+        """Новый пост автора меняет ETag ленты и других его постов."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+        etags = {url: self.guest_client.get(url)['ETag'] for url in urls}
+        Post.objects.create(text='Новый пост', author=self.author)
+
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_etag_depends_on_user(self):
+        """ETag гостя не подходит авторизованному пользователю."""
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            self.revalidate(self.author_client, url).status_code,
+            HTTPStatus.NOT_MODIFIED
+        )
+
+
+class ProxyHeadersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='proxy_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='proxy-group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Текст', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        cache.clear()
+
+    def test_pages_tagged_with_surrogate_keys(self):
+        """Страницы помечены ключами всего, что на них показано."""
+        card = {f'post-{self.post.pk}', f'author-{self.author.pk}',
+                'group-proxy-group'}
+        pages = {
+            reverse('posts:index'): card | {'feed-index'},
+            reverse('posts:group_list', args=[self.group.slug]): card,
+            reverse('posts:profile', args=[self.author.username]):
+                card | {f'profile-{self.author.pk}'},
+            reverse('posts:post_detail', args=[self.post.pk]):
+                card | {f'post-page-{self.post.pk}'},
+        }
+        for url, keys in pages.items():
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertLessEqual(
+                    keys, set(response['Surrogate-Key'].split()))
+
+    def test_only_anonymous_pages_are_public(self):
+        """Прокси хранит только страницы гостей."""
+        url = reverse('posts:index')
+
+        guest_response = self.guest_client.get(url)
+        author_response = self.author_client.get(url)
+
+        self.assertIn('public', guest_response['Cache-Control'])
+        self.assertIn('s-maxage', guest_response['Cache-Control'])
+        self.assertIn('private', author_response['Cache-Control'])
+        self.assertIn('Cookie', guest_response['Vary'])
+
+    def test_stale_copy_is_not_stored_by_proxy(self):
+        """Старую копию, отданную во время пересчёта, прокси не хранит."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        Post.objects.create(text='Новый пост', author=self.author)
+
+        with mock.patch('core.cache_access.acquire', return_value=False):
+            stale = self.guest_client.get(url)
+
+        self.assertIn('no-store', stale['Cache-Control'])
+        self.assertNotIn('public', stale['Cache-Control'])
+        self.assertNotIn('s-maxage', stale['Cache-Control'])
+
+
+class PurgeTest(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        received_purges.clear()
+        self.author = User.objects.create(username='purge_author')
+        self.group = Group.objects.create(
+            title='Группа', slug='purge-group', description='Описание')
+
+    def purged_keys(self):
+        return {key for keys in received_purges for key in keys}
+
+    def test_writes_purge_proxy(self):
+        """Запись поста и комментария отправляет ключи на сброс."""
+        with self.settings(PURGE_URL=f'{self.live_server_url}/__purge__/'):
+            post = Post.objects.create(
+                text='Текст', author=self.author, group=self.group)
+            Comment.objects.create(
+                post=post, author=self.author, text='Комментарий')
+
+        self.assertLessEqual(
+            {'feed-index', f'post-{post.pk}', f'author-{self.author.pk}',
+             'group-purge-group'},
+            self.purged_keys()
+        )
+        self.assertEqual(len(received_purges), 2)
+
+    def test_comments_and_follows_purge_own_pages(self):
+        """Комментарий и подписка сбрасывают только свою страницу."""
+        post = Post.objects.create(text='Текст', author=self.author)
+        reader = User.objects.create(username='purge_reader')
+        with self.settings(PURGE_URL=f'{self.live_server_url}/__purge__/'):
+            Comment.objects.create(
+                post=post, author=reader, text='Комментарий')
+            Follow.objects.create(user=reader, author=self.author)
+
+        self.assertEqual(list(received_purges), [
+            [f'post-page-{post.pk}'], [f'profile-{self.author.pk}']])
+
+    def test_no_purge_without_endpoint(self):
+        """Без адреса сброса запросы к прокси не отправляются."""
+        Post.objects.create(text='Текст', author=self.author)
+
+        self.assertEqual(len(received_purges), 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='thumb_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def uploaded_image(self, name='photo.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), (200, 30, 30)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+    def test_upload_prepares_thumbnail(self):
+        """Миниатюра готовится при загрузке и выводится в ленте."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=self.uploaded_image())
+        thumbnail = post.thumbnails.get(geometry='960x339', format='jpeg')
+
+        response = self.client.get(reverse('posts:index'))
+
+        self.assertEqual(thumbnail.source, post.image.name)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_responsive_variants(self):
+        """Картинка отдается в нескольких ширинах в WebP и JPEG."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=self.uploaded_image())
+        variants = {(thumbnail.width, thumbnail.format): thumbnail
+                    for thumbnail in post.thumbnails.all()}
+
+        response = self.client.get(reverse('posts:index'))
+
+        self.assertEqual(set(variants), {
+            (width, format_) for width in (320, 640, 960)
+            for format_ in ('jpeg', 'webp')
+        })
+        self.assertEqual(variants[(320, 'jpeg')].height, 113)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'sizes="')
+        for (width, format_), variant in variants.items():
+            with self.subTest(width=width, format=format_):
+                self.assertContains(response, f'{variant.url} {width}w')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_placeholder_until_prepared(self):
+        """Пока миниатюра не готова, вместо нее выводится заглушка."""
+        with mock.patch('posts.thumbnails.prepare_thumbnails') as prepare:
+            Post.objects.create(
+                text='Текст', author=self.author, image=self.uploaded_image())
+
+        response = self.client.get(reverse('posts:index'))
+
+        prepare.assert_not_called()
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertNotContains(response, '<img class="card-img')
+
+    def test_page_thumbnails_resolved_in_one_query(self):
+        """Миниатюры всех постов страницы находятся одним запросом."""
+        for num in range(3):
+            Post.objects.create(text=f'Текст {num}', author=self.author,
+                                image=self.uploaded_image(f'photo{num}.png'))
+        posts = list(Post.objects.select_related('author', 'group'))
+
+        with self.assertNumQueries(1):
+            cards = render_cards(posts)
+
+        for post, card in zip(posts, cards):
+            with self.subTest(post=post.pk):
+                self.assertIn(post.thumbnails.get(
+                    geometry='960x339', format='jpeg').url, card)
+
+    def test_command_prepares_missing_thumbnails(self):
+        """Команда готовит миниатюры, которых не хватает."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=self.uploaded_image())
+        post.thumbnails.all().delete()
+
+        call_command('prepare_thumbnails', workers=0, stdout=StringIO())
+
+        self.assertTrue(post.thumbnails.filter(
+            source=post.image.name).exists())
+
+    def test_identical_uploads_share_files(self):
+        """Одинаковые картинки и их миниатюры хранятся один раз."""
+        first, second = [
+            Post.objects.create(text='Мем', author=self.author,
+                                image=self.uploaded_image(f'meme{num}.png'))
+            for num in range(2)
+        ]
+        thumbnail = first.thumbnails.get(geometry='960x339', format='jpeg')
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(second.thumbnails.get(
+            geometry='960x339', format='jpeg').name, thumbnail.name)
+        self.assertEqual(StoredFile.objects.get(
+            name=first.image.name).references, 2)
+        self.assertEqual(StoredFile.objects.get(
+            name=thumbnail.name).references, 2)
+
+    def test_command_rehashes_media(self):
+        """Команда переносит старые файлы в хранилище по хешу."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=self.uploaded_image())
+        legacy = FileSystemStorage().save(
+            'posts/legacy.png', self.uploaded_image())
+        Post.objects.filter(pk=post.pk).update(image=legacy)
+
+        call_command('rehash_media', stdout=StringIO())
+        post.refresh_from_db()
+
+        self.assertTrue(is_hashed(post.image.name))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImagePlaceholderTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='lqip_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def uploaded_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), (30, 120, 200)).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), 'image/png')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_placeholder_shown_while_pending(self):
+        """Превью считается при сохранении и видно до миниатюр."""
+        with mock.patch('posts.thumbnails.prepare_thumbnails'):
+            post = Post.objects.create(
+                text='Текст', author=self.author, image=self.uploaded_image())
+        post.refresh_from_db()
+
+        response = self.client.get(reverse('posts:index'))
+
+        self.assertNotContains(response, '<img class="card-img')
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/png;base64,'))
+        self.assertLess(len(post.image_placeholder), 400)
+        self.assertContains(response, post.image_placeholder)
+
+    def test_command_backfills_placeholders(self):
+        """Команда досчитывает превью для старых картинок."""
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=self.uploaded_image())
+        Post.objects.filter(pk=post.pk).update(image_placeholder='')
+
+        call_command('backfill_placeholders', workers=0, stdout=StringIO())
+        post.refresh_from_db()
+
+        self.assertNotEqual(post.image_placeholder, '')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='searcher')
+        cls.group = Group.objects.create(
+            title='Котики', slug='cats', description='Описание')
+        cls.once = Post.objects.create(
+            text='Ёжик ушёл в туман, а котёнок остался дома',
+            author=cls.author)
+        cls.twice = Post.objects.create(
+            text='Котёнок и ещё один котёнок', author=cls.author)
+        cls.in_group = Post.objects.create(
+            text='Пост без нужных слов', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        self.client = Client()
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_ranked_results(self):
+        """Посты с большим числом совпадений идут первыми."""
+        self.assertEqual(self.found('котёнок'),
+                         [self.twice.pk, self.once.pk])
+
+    def test_words_prefix_and_diacritics(self):
+        """Ищутся все слова, последнее по началу, ё не отличается от е."""
+        self.assertEqual(self.found('ежик тума'), [self.once.pk])
+        self.assertEqual(self.found('ежик котята'), [])
+
+    def test_group_title_is_searched_and_synced(self):
+        """Название группы ищется и обновляется вместе с группой."""
+        self.assertEqual(self.found('котики'), [self.in_group.pk])
+
+        Group.objects.filter(pk=self.group.pk).update(title='Собаки')
+
+        self.assertEqual(self.found('котики'), [])
+        self.assertEqual(self.found('собаки'), [self.in_group.pk])
+
+    def test_index_follows_post_writes(self):
+        """Правка и удаление поста сразу видны в поиске."""
+        Post.objects.filter(pk=self.once.pk).update(text='Новый текст')
+        self.assertEqual(self.found('ежик'), [])
+        self.assertEqual(self.found('новый'), [self.once.pk])
+
+        Post.objects.filter(pk=self.once.pk).delete()
+        self.assertEqual(self.found('новый'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Кавычки и операторы из запроса не ломают поиск."""
+        for query in ('"котёнок', 'котёнок OR NOT', '*', '', 'NEAR('):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    reverse('posts:search'), {'q': query})
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_pages_keep_the_query(self):
+        """Ссылки на страницы результатов сохраняют запрос."""
+        Post.objects.bulk_create([
+            Post(text=f'Котёнок номер {num}', author=self.author)
+            for num in range(settings.POSTS_PER_PAGE + 1)
+        ])
+
+        response = self.client.get(reverse('posts:search'), {'q': 'котёнок'})
+
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        self.assertContains(response, 'href="?q=%D0%BA%D0%BE%D1%82%D1%91'
+                                      '%D0%BD%D0%BE%D0%BA&amp;page=2"')
+        self.assertEqual(len(self.found('котёнок', page=2)), 3)
+
+    def test_rebuild_command(self):
+        """Команда заново строит индекс из таблицы постов."""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_post_search')
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual(self.found('котёнок'),
+                         [self.twice.pk, self.once.pk])
@@ -0,0 +1,226 @@
+import base64
+import hashlib
+import io
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from PIL import Image, ImageOps, features
+
+from core.background import BoundedPool
+from core.query_budget import off_budget
+from .models import Post, PostThumbnail
+
+
+# Frame of the feed images; narrower variants keep its ratio and are
+# cropped around the center.
+GEOMETRY = '960x339'
+WIDTHS = (320, 640, 960)
+# Pillow format name, file extension and encoder options.
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True,
+                             'progressive': True}),
+}
+THUMBNAIL_DIR = 'thumbnails'
+# Width of the blurred preview inlined into pages.
+PLACEHOLDER_WIDTH = 16
+
+logger = logging.getLogger(__name__)
+
+pool = BoundedPool('THUMBNAIL_WORKERS', 'THUMBNAIL_QUEUE_SIZE')
+
+
+def thumbnail_workers() -> int:
+    return pool.workers()
+
+
+def parse_geometry(geometry: str) -> tuple:
+    width, height = geometry.split('x')
+    return int(width), int(height)
+
+
+def variants() -> list:
+    """(geometry, format) of every prepared copy, narrowest first"""
+    frame_width, frame_height = parse_geometry(GEOMETRY)
+    formats = [name for name, (pil_format, _, _) in FORMATS.items()
+               if pil_format != 'WEBP' or features.check('webp')]
+    return [
+        (f'{width}x{round(frame_height * width / frame_width)}', format_)
+        for width in WIDTHS for format_ in formats
+    ]
+
+
+def thumbnail_name(post: Post, geometry: str, format_: str) -> str:
+    digest = hashlib.md5(post.image.name.encode()).hexdigest()[:12]
+    extension = FORMATS[format_][1]
+    return f'{THUMBNAIL_DIR}/{digest}_{geometry}.{extension}'
+
+
+def render_thumbnail(image, geometry: str, format_: str) -> bytes:
+    """Center crop to the geometry, upscaling small images"""
+    pil_format, _, options = FORMATS[format_]
+    thumbnail = ImageOps.fit(image, parse_geometry(geometry), Image.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.convert('RGB').save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_placeholder(image) -> str:
+    """Frame-shaped preview a few pixels wide as a data URI"""
+    frame_width, frame_height = parse_geometry(GEOMETRY)
+    size = (PLACEHOLDER_WIDTH,
+            max(1, round(frame_height * PLACEHOLDER_WIDTH / frame_width)))
+    preview = ImageOps.fit(image, size, Image.LANCZOS).convert('RGB')
+    buffer = io.BytesIO()
+    preview.save(buffer, 'PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def open_image(name: str, storage=default_storage):
+    with storage.open(name) as source:
+        image = Image.open(source)
+        image.load()
+    return image
+
+
+def preview_upload(post: Post) -> None:
+    """
+    Blurred preview of an image that is not stored yet, so the post is
+    saved with it and shows it while the thumbnails are prepared.
+    """
+    upload = post.image.file
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            image.load()
+            post.image_placeholder = render_placeholder(image)
+    except (OSError, ValueError) as error:
+        logger.warning('Не удалось открыть картинку поста %s: %s',
+                       post.pk, error)
+        post.image_placeholder = ''
+    finally:
+        upload.seek(0)
+
+
+def placeholder_for(post_id: int, name: str) -> tuple:
+    """Preview of one stored image, runs in the backfill pool"""
+    try:
+        return post_id, render_placeholder(open_image(name))
+    except (OSError, ValueError, SuspiciousFileOperation) as error:
+        logger.warning('Не удалось открыть картинку поста %s: %s',
+                       post_id, error)
+        return post_id, None
+
+
+def prepare_thumbnails(post_id: int) -> None:
+    """Renders every variant of the post image and records them"""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    try:
+        image = open_image(post.image.name, post.image.storage)
+    except (OSError, ValueError, SuspiciousFileOperation) as error:
+        logger.warning('Не удалось открыть картинку поста %s: %s',
+                       post_id, error)
+        return
+    storage = post.image.storage
+    previous = {(thumbnail.geometry, thumbnail.format): thumbnail.name
+                for thumbnail in post.thumbnails.all()}
+    # Posts sharing the stored image share its thumbnails too.
+    shared = {(thumbnail.geometry, thumbnail.format): thumbnail.name
+              for thumbnail in PostThumbnail.objects.filter(
+                  source=post.image.name).exclude(post=post)}
+    for geometry, format_ in variants():
+        name = shared.get((geometry, format_))
+        if (name is not None and hasattr(storage, 'reference')
+                and storage.exists(name)):
+            storage.reference(name)
+        else:
+            name = storage.save(
+                thumbnail_name(post, geometry, format_),
+                ContentFile(render_thumbnail(image, geometry, format_)))
+        width, height = parse_geometry(geometry)
+        PostThumbnail.objects.update_or_create(
+            post=post, geometry=geometry, format=format_,
+            defaults={'source': post.image.name, 'name': name,
+                      'width': width, 'height': height}
+        )
+        if (geometry, format_) in previous:
+            storage.delete(previous[geometry, format_])
+    fields = ['modified']
+    if not post.image_placeholder:
+        # Images stored without an upload get their preview here.
+        post.image_placeholder = render_placeholder(image)
+        fields.append('image_placeholder')
+    # Cached cards and pages still show the placeholder.
+    post.save(update_fields=fields)
+
+
+def missing_thumbnails() -> list:
+    """Ids of posts whose current image lacks some of the variants"""
+    ready = set(
+        PostThumbnail.objects.filter(post__image=F('source'))
+        .values('post_id').annotate(count=Count('pk'))
+        .filter(count=len(variants())).values_list('post_id', flat=True)
+    )
+    return [pk for pk in Post.objects.exclude(image='').values_list(
+        'pk', flat=True) if pk not in ready]
+
+
+def enqueue(post_id: int) -> None:
+    """
+    Hands the post to the pool; when the queue is full the post keeps
+    its placeholder until prepare_thumbnails is run for it.
+    """
+    if not pool.submit(prepare_thumbnails, post_id):
+        logger.warning('Очередь миниатюр заполнена, пост %s пропущен',
+                       post_id)
+
+
+def schedule(post: Post) -> None:
+    """Prepares thumbnails of a new image outside of the request"""
+    if not thumbnail_workers():
+        with off_budget():
+            prepare_thumbnails(post.pk)
+        return
+    transaction.on_commit(lambda: enqueue(post.pk))
+
+
+def attach_thumbnails(posts) -> None:
+    """
+    Resolves the prepared variants of many posts in one query, the
+    template tags then read them from post.prepared_thumbnails.
+    """
+    posts = [post for post in posts if post.image]
+    by_post = {post.pk: post for post in posts}
+    for post in posts:
+        post.prepared_thumbnails = []
+    for thumbnail in PostThumbnail.objects.filter(
+            post_id__in=by_post).order_by('width'):
+        post = by_post[thumbnail.post_id]
+        if thumbnail.source == post.image.name:
+            post.prepared_thumbnails.append(thumbnail)
+
+
+def prepared_variants(post: Post) -> list:
+    """Ready variants of the current post image, narrowest first"""
+    if not post.image:
+        return []
+    attached = getattr(post, 'prepared_thumbnails', None)
+    if attached is not None:
+        return attached
+    return list(post.thumbnails.filter(
+        source=post.image.name).order_by('width'))
+
+
+def prepared_thumbnail(post: Post, geometry: str, format_: str = 'jpeg'):
+    """Ready thumbnail of the current post image or None"""
+    for thumbnail in prepared_variants(post):
+        if thumbnail.geometry == geometry and thumbnail.format == format_:
+            return thumbnail
+    return None
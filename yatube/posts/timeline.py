@@ -0,0 +1,241 @@
+import heapq
+import logging
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from core.background import BoundedPool
+from .follow_set import followed_ids
+from .models import Post, Follow, TimelineEntry, AuthorStats
+
+
+CELEBRITY_KEY = 'timeline:celebrity:{}'
+RECENT_POSTS_KEY = 'timeline:recent:{}'
+# Copies of the post (pub_date, id) the timeline index is sorted on.
+TIMELINE_KEYS = ('timeline_entries__pub_date', 'timeline_entries__post_id')
+# A copy read from the database just before a change lives this long.
+CELEBRITY_CACHE_TIMEOUT = 60 * 5
+
+logger = logging.getLogger(__name__)
+
+# Timeline maintenance: demotion backfills and trims after fan-out.
+pool = BoundedPool('TIMELINE_WORKERS', 'TIMELINE_QUEUE_SIZE', workers=1)
+
+
+def timeline_max_length() -> int:
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def fanout_threshold() -> int:
+    return getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 1000)
+
+
+def demotion_threshold() -> int:
+    return getattr(settings, 'TIMELINE_DEMOTION_THRESHOLD',
+                   fanout_threshold() * 4 // 5)
+
+
+def update_celebrity(author_id: int) -> bool:
+    """
+    Stores whether the author is merged into feeds at read time. An
+    author becomes one above the fan-out threshold and stops being one
+    at the lower demotion threshold, so followers coming and going
+    around a single number do not flip it. Demotion backfills all the
+    followers, it is left to the pool and the author stays merged at
+    read time until it is done.
+    """
+    followers, was_celebrity = AuthorStats.objects.filter(
+        user_id=author_id).values_list(
+        'followers_count', 'is_celebrity').first() or (0, False)
+    if followers > fanout_threshold():
+        is_celebrity = True
+    elif followers <= demotion_threshold():
+        is_celebrity = False
+    else:
+        is_celebrity = was_celebrity
+    if was_celebrity and not is_celebrity:
+        schedule_demotion(author_id)
+        return True
+    if is_celebrity and not was_celebrity:
+        set_celebrity(author_id, True)
+    return is_celebrity
+
+
+def set_celebrity(author_id: int, is_celebrity: bool) -> None:
+    """The flag lives in AuthorStats, the cache only spares the reads"""
+    AuthorStats.objects.filter(user_id=author_id).update(
+        is_celebrity=is_celebrity)
+    cache.set(CELEBRITY_KEY.format(author_id), is_celebrity,
+              CELEBRITY_CACHE_TIMEOUT)
+
+
+def schedule_demotion(author_id: int) -> None:
+    """Without workers the author waits for demote_celebrities"""
+    if pool.workers():
+        transaction.on_commit(lambda: submit_demotion(author_id))
+
+
+def submit_demotion(author_id: int) -> None:
+    if not pool.submit(demote, author_id):
+        logger.warning('Очередь заполнена, автор %s остается звездой до '
+                       'demote_celebrities', author_id)
+
+
+def demote(author_id: int) -> None:
+    """
+    Copies the author posts into the timelines of all followers, then
+    lets new posts fan out. Posts published meanwhile are fanned out
+    afterwards, they made it neither into a backfill nor a fan-out.
+    """
+    followers, is_celebrity = AuthorStats.objects.filter(
+        user_id=author_id).values_list(
+        'followers_count', 'is_celebrity').first() or (0, False)
+    if not is_celebrity or followers > demotion_threshold():
+        return
+    started = timezone.now()
+    follower_ids = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    for user_id in follower_ids.iterator():
+        backfill(user_id, author_id)
+    set_celebrity(author_id, False)
+    for post in Post.objects.filter(
+            author_id=author_id, pub_date__gte=started):
+        fan_out(post)
+
+
+def celebrity_ids(author_ids) -> list:
+    """Returns the authors that are merged into feeds at read time"""
+    keys = {CELEBRITY_KEY.format(pk): pk for pk in author_ids}
+    known = cache.get_many(keys)
+    missing = [pk for key, pk in keys.items() if key not in known]
+    if missing:
+        flags = dict(AuthorStats.objects.filter(
+            user_id__in=missing).values_list('user_id', 'is_celebrity'))
+        fresh = {CELEBRITY_KEY.format(pk): flags.get(pk, False)
+                 for pk in missing}
+        cache.set_many(fresh, CELEBRITY_CACHE_TIMEOUT)
+        known.update(fresh)
+    return [pk for key, pk in keys.items() if known[key]]
+
+
+def recent_posts(author_id: int) -> list:
+    """Cached (pub_date, pk) pairs of the newest author posts"""
+    key = RECENT_POSTS_KEY.format(author_id)
+    recent = cache.get(key)
+    if recent is None:
+        recent = list(
+            Post.objects.filter(author_id=author_id)
+            .values_list('pub_date', 'pk')[:timeline_max_length()]
+        )
+        cache.set(key, recent, None)
+    return recent
+
+
+def forget_recent_posts(author_id: int) -> None:
+    cache.delete(RECENT_POSTS_KEY.format(author_id))
+
+
+def fan_out(post: Post) -> bool:
+    """
+    Pushes a new post into the timelines of all author followers,
+    False for authors merged at read time.
+    """
+    if celebrity_ids([post.author_id]):
+        return False
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids],
+        ignore_conflicts=True
+    )
+    return True
+
+
+def schedule_trim(author_id: int) -> None:
+    """
+    Trims the timelines a fan-out grew in the pool. Without workers, or
+    with a full queue, they wait for trim_timelines.
+    """
+    if pool.workers():
+        transaction.on_commit(lambda: submit_trim(author_id))
+
+
+def submit_trim(author_id: int) -> None:
+    if not pool.submit(trim_followers, author_id):
+        logger.warning('Очередь заполнена, ленты подписчиков автора %s '
+                       'ждут trim_timelines', author_id)
+
+
+def trim_followers(author_id: int) -> None:
+    follower_ids = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    for user_id in list(follower_ids):
+        trim(user_id)
+
+
+def backfill(user_id: int, author_id: int) -> None:
+    """Copies recent author posts into the user timeline"""
+    recent = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:timeline_max_length()]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in recent],
+        ignore_conflicts=True
+    )
+    trim(user_id)
+
+
+def remove_author(user_id: int, author_id: int) -> None:
+    """Drops all author posts from the user timeline"""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def trim(user_id: int) -> None:
+    """
+    Keeps only the newest entries of the user timeline: one lookup of
+    the boundary on the timeline index, a delete only past the cap.
+    """
+    boundary = TimelineEntry.objects.filter(user_id=user_id).values_list(
+        'pub_date', flat=True)[timeline_max_length():][:1]
+    boundary = list(boundary)
+    if boundary:
+        TimelineEntry.objects.filter(
+            user_id=user_id, pub_date__lte=boundary[0]).delete()
+
+
+def follow_feed(user) -> QuerySet:
+    """Posts of the authors the user follows, see keyed_follow_feed"""
+    return keyed_follow_feed(user)[0]
+
+
+def keyed_follow_feed(user) -> tuple:
+    """
+    Posts of the authors the user follows and the (date, id) keys to
+    page them on. Fanned-out posts come from the materialized timeline
+    and are sorted on its index; posts of authors above the fan-out
+    threshold are k-way merged in from their cached recent lists.
+    """
+    timeline = Post.objects.filter(timeline_entries__user=user).order_by(
+        *(F(key).desc() for key in TIMELINE_KEYS))
+    celebrities = celebrity_ids(followed_ids(user.pk))
+    if not celebrities:
+        return timeline, TIMELINE_KEYS
+    limit = timeline_max_length()
+    streams = [
+        TimelineEntry.objects.filter(user=user).values_list(
+            'pub_date', 'post_id')[:limit]
+    ]
+    streams += [recent_posts(author_id) for author_id in celebrities]
+    post_ids = set()
+    for _, pk in heapq.merge(*streams, key=itemgetter(0), reverse=True):
+        post_ids.add(pk)
+        if len(post_ids) == limit:
+            break
+    return Post.objects.filter(pk__in=post_ids), None
@@ -1,11 +1,190 @@
+import base64
+import binascii
+
+from django.conf import settings
 from django.core.paginator import Paginator, Page
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
 from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_datetime
 
 
-def create_page_obj(post_list: QuerySet, posts_per_page: int,
-                    request) -> Page:
-    """Creates paginator and returns page objects"""
-    paginator = Paginator(post_list, posts_per_page)
+CURSOR_PARAM = 'cursor'
+OLDER = 'o'
+NEWER = 'n'
+
+
+def encode_cursor(direction: str, pub_date, pk: int) -> str:
+    """Packs a seek position into an opaque url-safe token"""
+    raw = f'{direction}|{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str):
+    """Unpacks a token, returns (direction, pub_date, pk) or None"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (OLDER, NEWER) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Page):
+    """Page of a keyset paginator, navigated by tokens instead of numbers"""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_newer, has_older):
+        super().__init__(object_list, 1, paginator)
+        self._has_newer = has_newer
+        self._has_older = has_older
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def has_next(self):
+        return self._has_older
+
+    def has_previous(self):
+        return self._has_newer
+
+    def next_cursor(self):
+        if not self._has_older:
+            return None
+        if not self.object_list:
+            # A stale token seeked past every row: start over.
+            return ''
+        last = self.object_list[-1]
+        return encode_cursor(
+            OLDER, getattr(last, self.paginator.date_field), last.pk)
+
+    def previous_cursor(self):
+        if not self._has_newer:
+            return None
+        if not self.object_list:
+            return ''
+        first = self.object_list[0]
+        return encode_cursor(
+            NEWER, getattr(first, self.paginator.date_field), first.pk)
+
+
+class CursorPaginator(Paginator):
+    """
+    Seeks on (pub_date, id) instead of OFFSET and never runs COUNT(*),
+    so the cost of a page does not depend on how deep it is.
+    """
+    date_field = 'pub_date'
+
+    def __init__(self, object_list, per_page, date_field=None, keys=None,
+                 **kwargs):
+        """
+        keys are the (date, id) lookups to sort and seek on; they must
+        hold the date_field and pk of each row, like the columns a side
+        table copies from it.
+        """
+        super().__init__(object_list, per_page, **kwargs)
+        if date_field is not None:
+            self.date_field = date_field
+        self.keys = keys or (self.date_field, 'pk')
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._build_page(self.object_list, OLDER, False)
+        direction, pub_date, pk = position
+        queryset = self.object_list
+        date, pk_key = self.keys
+        if LOOKUP_SEP in date:
+            # filter() across a multi-valued relation joins it once more,
+            # an annotation reuses the join the ordering already made.
+            queryset = queryset.annotate(seek_date=F(date), seek_pk=F(pk_key))
+            date, pk_key = 'seek_date', 'seek_pk'
+        # A range on the date plus a residual filter on the tie keeps the
+        # seek on a single index scan, unlike an OR of two ranges. It
+        # uses the keys of the sort, or the index cannot serve it.
+        if direction == OLDER:
+            seek = (Q(**{f'{date}__lte': pub_date})
+                    & ~Q(**{date: pub_date, f'{pk_key}__gte': pk}))
+        else:
+            seek = (Q(**{f'{date}__gte': pub_date})
+                    & ~Q(**{date: pub_date, f'{pk_key}__lte': pk}))
+        return self._build_page(queryset.filter(seek), direction, True)
+
+    def _build_page(self, queryset, direction, came_from_other_side):
+        date_key, id_key = self.keys
+        if direction == OLDER:
+            queryset = queryset.order_by(F(date_key).desc(), F(id_key).desc())
+        else:
+            queryset = queryset.order_by(F(date_key).asc(), F(id_key).asc())
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == OLDER:
+            return CursorPage(rows, self, came_from_other_side, has_more)
+        rows.reverse()
+        return CursorPage(rows, self, has_more, came_from_other_side)
+
+
+def page_window(page_obj: Page, on_each_side: int = 3,
+                on_ends: int = 1) -> list:
+    """
+    Page numbers to show around the current page: the first and last
+    pages plus a window around the current one, None marks a gap.
+    """
+    number = page_obj.number
+    num_pages = page_obj.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+    window_start = max(number - on_each_side, 1)
+    window_end = min(number + on_each_side, num_pages)
+    pages = list(range(1, min(on_ends, window_start - 1) + 1))
+    if window_start > on_ends + 1:
+        if window_start - on_ends > 2:
+            pages.append(None)
+        else:
+            pages.extend(range(on_ends + 1, window_start))
+    pages.extend(range(window_start, window_end + 1))
+    tail_start = max(num_pages - on_ends + 1, window_end + 1)
+    if tail_start > window_end + 1:
+        if tail_start - window_end > 2:
+            pages.append(None)
+        else:
+            pages.extend(range(window_end + 1, tail_start))
+    pages.extend(range(tail_start, num_pages + 1))
+    return pages
+
+
+def use_cursor_pagination(request) -> bool:
+    return (CURSOR_PARAM in request.GET
+            or getattr(settings, 'POSTS_CURSOR_PAGINATION', False))
+
+
+def create_numbered_page(object_list: QuerySet, per_page: int,
+                         request) -> Page:
+    """Page by number, for lists not ordered by date"""
+    paginator = Paginator(object_list, per_page)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.page_window = page_window(page_obj)
     return page_obj
+
+
+def create_page_obj(post_list: QuerySet, posts_per_page: int,
+                    request, keys=None) -> Page:
+    """Creates paginator and returns page objects"""
+    if use_cursor_pagination(request):
+        paginator = CursorPaginator(post_list, posts_per_page, keys=keys)
+        return paginator.get_page(request.GET.get(CURSOR_PARAM))
+    return create_numbered_page(post_list, posts_per_page, request)
+
+
+def create_comments_page(comment_list: QuerySet, comments_per_page: int,
+                         request) -> CursorPage:
+    """Returns a chunk of comments starting at the request cursor"""
+    paginator = CursorPaginator(comment_list, comments_per_page,
+                                date_field='created')
+    return paginator.get_page(request.GET.get(CURSOR_PARAM))
@@ -1,71 +1,122 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
-from posts.models import Post, Group, Follow
+from core.proxy import add_surrogate_keys
+
+from posts.models import Post, Follow
 from .forms import PostForm, CommentForm
-from .utils import create_page_obj
+from .utils import (
+    create_page_obj, create_comments_page, create_numbered_page
+)
+from .timeline import keyed_follow_feed
+from .counters import author_stats
+from .follow_set import is_following
+from .lookups import group_by_slug, user_by_username
+from .search import search_posts
+from .surrogate import (
+    INDEX_KEY, author_key, card_keys, group_key, page_keys, post_page_key,
+    profile_key
+)
+from .feed_cache import (
+    SHARED_SCOPE, cache_feed, index_scope, group_scope, author_scope,
+    post_scope, post_author_scopes
+)
 
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
 
 User = get_user_model()
 
 
-@cache_page(20)
+@cache_feed(lambda request: [index_scope(), SHARED_SCOPE])
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.select_related('author', 'group')
     page_obj = create_page_obj(post_list, POSTS_PER_PAGE, request)
     context = {
         'page_obj': page_obj
     }
-    return render(request, 'posts/index.html', context)
+    response = render(request, 'posts/index.html', context)
+    add_surrogate_keys(response, [INDEX_KEY] + page_keys(page_obj))
+    return response
 
 
+@cache_feed(lambda request, slug: [group_scope(slug), SHARED_SCOPE])
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    group = group_by_slug.get_or_404(slug)
+    post_list = group.posts.select_related('author', 'group')
     page_obj = create_page_obj(post_list, POSTS_PER_PAGE, request)
     context = {
         'group': group,
         'page_obj': page_obj,
     }
-    return render(request, 'posts/group_list.html', context)
+    response = render(request, 'posts/group_list.html', context)
+    add_surrogate_keys(response, [group_key(slug)] + page_keys(page_obj))
+    return response
 
 
+@cache_feed(
+    lambda request, username: [author_scope(username), SHARED_SCOPE])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    count_posts = post_list.count()
+    author = user_by_username.get_or_404(username)
+    post_list = author.posts.select_related('author', 'group')
+    count_posts = author_stats(author).posts_count
     page_obj = create_page_obj(post_list, POSTS_PER_PAGE, request)
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user,
-            author=author).exists()
-    else:
-        following = False
     context = {
         'author': author,
         'page_obj': page_obj,
         'count_posts': count_posts,
-        'following': following
     }
-    return render(request, 'posts/profile.html', context)
+    response = render(request, 'posts/profile.html', context)
+    add_surrogate_keys(
+        response,
+        [profile_key(author.pk), author_key(author.pk)] + page_keys(page_obj))
+    return response
 
 
+@cache_feed(
+    lambda request, post_id: [post_scope(post_id), SHARED_SCOPE],
+    hole_scopes=lambda request, post_id: post_author_scopes(post_id)
+)
 def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    comments = create_comments_page(
+        post.comments.select_related('author'), COMMENTS_PER_PAGE, request)
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    response = render(request, 'posts/post_detail.html', context)
+    add_surrogate_keys(response, [post_page_key(post.pk)] + card_keys(post))
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    post_list = search_posts(
+        Post.objects.select_related('author', 'group'), query)
+    page_obj = create_numbered_page(post_list, POSTS_PER_PAGE, request)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_params': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_comments(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    author = post.author
-    comments = post.comments.all()
-    count_posts = author.posts.all().count()
+    comments = create_comments_page(
+        post.comments.select_related('author'), COMMENTS_PER_PAGE, request)
     context = {
         'post': post,
-        'count_posts': count_posts,
-        'form': CommentForm(),
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render(request, 'includes/comments.html', context)
 
 
 @login_required
@@ -119,8 +170,10 @@ def add_comment(request, post_id):
 
 @login_required()
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = create_page_obj(post_list, POSTS_PER_PAGE, request)
+    post_list, keys = keyed_follow_feed(request.user)
+    page_obj = create_page_obj(
+        post_list.select_related('author', 'group'), POSTS_PER_PAGE, request,
+        keys=keys)
     context = {
         'page_obj': page_obj,
     }
@@ -129,8 +182,9 @@ def follow_index(request):
 
 @login_required()
 def profile_follow(request, username):
-    get_author = get_object_or_404(User, username=username)
-    if request.user != get_author:
+    get_author = user_by_username.get_or_404(username)
+    if (request.user != get_author
+            and not is_following(request.user.pk, get_author.pk)):
         Follow.objects.get_or_create(
             user=request.user,
             author=get_author
@@ -140,7 +194,7 @@ def profile_follow(request, username):
 
 @login_required()
 def profile_unfollow(request, username):
-    get_author = get_object_or_404(User, username=username)
+    get_author = user_by_username.get_or_404(username)
     Follow.objects.filter(user=request.user, author=get_author).delete()
 
     return redirect('posts:profile', username=username)
@@ -1,4 +1,5 @@
 import os
+import sys
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'core.middleware.QueryBudgetMiddleware',
 ]
 
 INTERNAL_IPS = [
@@ -94,12 +96,46 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+TESTING = 'test' in sys.argv or 'pytest' in sys.modules
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        'BACKEND': 'core.cache.TwoTierCache',
+        # Test runs get a private in-memory store instead of the file
+        # shared by the workers.
+        'LOCATION': ('file:yatube-cache?mode=memory&cache=shared'
+                     if TESTING else os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 300,
+        },
     }
 }
 
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CACHE_LOCK_TIMEOUT = 10
+CACHE_STALE_TIMEOUT = 60 * 5
+CACHE_EARLY_BETA = 1.0
+
+# Reverse proxy in front of the site: how long it may keep anonymous
+# pages and where PURGE requests with surrogate keys go on writes.
+SURROGATE_MAX_AGE = 60 * 60 * 24
+PURGE_URL = None
+PURGE_TIMEOUT = 2
+# Serves a stand-in purge endpoint at /__purge__/.
+PURGE_RECEIVER = DEBUG
+
+# Thumbnails of uploaded images are rendered by a process pool, tests
+# render them inline.
+THUMBNAIL_WORKERS = 0 if TESTING else 2
+THUMBNAIL_QUEUE_SIZE = 100
+# Uploads with more pixels are rejected from the header, the rest are
+# stored downscaled to fit IMAGE_MAX_SIDE.
+IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+IMAGE_MAX_SIDE = 2048
+
 
 LANGUAGE_CODE = 'ru'
 
@@ -120,8 +156,44 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads are named by content hash, identical files are stored once.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# 'x-accel-redirect' for nginx with an internal location at
+# MEDIA_ACCEL_PREFIX, 'x-sendfile' for Apache; None sends files from
+# Python.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Hashed file names are cached for a year regardless.
+MEDIA_MAX_AGE = 60 * 60
 
 POSTS_PER_PAGE = 10
+POSTS_CURSOR_PAGINATION = False
+
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_FANOUT_THRESHOLD = 1000
+# Authors merged at read time go back to fan-out at this many followers.
+TIMELINE_DEMOTION_THRESHOLD = 800
+# Without workers demotions and trims wait for demote_celebrities and
+# trim_timelines.
+TIMELINE_WORKERS = 0 if TESTING else 1
+TIMELINE_QUEUE_SIZE = 100
+
+QUERY_BUDGET = 20
+QUERY_BUDGETS = {
+    'posts:index': 8,
+    'posts:group_list': 8,
+    'posts:profile': 8,
+    'posts:post_detail': 8,
+    'posts:follow_index': 8,
+    'posts:post_comments': 5,
+    'posts:search': 8,
+    # Storing an upload reference-counts its files; thumbnails prepared
+    # inline are counted apart (core.query_budget.off_budget).
+    'posts:post_create': 20,
+    'posts:post_edit': 24,
+}
+# Over-budget views fail the tests and only log in production.
+QUERY_BUDGET_RAISE = TESTING
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 import debug_toolbar
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import purge_receiver, serve_media
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
@@ -16,8 +17,12 @@ handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'
 handler500 = 'core.views.server_error'
 
+if settings.PURGE_RECEIVER:
+    urlpatterns.append(path('__purge__/', purge_receiver))
+
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns.append(
+        path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media))
+
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
     urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))